@@ -0,0 +1,205 @@
+"""
+Embedding throughput benchmark'ı
+generate_embedding (tekil) ve generate_embeddings_batch (toplu) için texts/sec ve
+p50/p99 gecikmeyi; batch boyutu, metin uzunluğu, torch thread sayısı ve backend
+kombinasyonlarında ölçer ve JSON rapor yazar.
+
+Kullanım:
+    python benchmark_embeddings.py --backends torch,onnx --threads 1,2,4 --output embedding_benchmark.json
+    python benchmark_embeddings.py --baseline eski_rapor.json   # %15'ten fazla yavaşlama varsa exit code 1
+"""
+from config import settings
+from services import embedding_service
+from datetime import datetime, timezone
+import numpy as np
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+import os
+
+# Sentetik metin için kelime havuzu (Türkçe + teknik terimler)
+VOCABULARY = (
+    "veri analiz model yapay zeka öğrenme sistem bilgi kaynak belge arama vektör "
+    "sorgu performans sunucu işlemci bellek ağ güvenlik kullanıcı rapor tablo "
+    "SAP ABAP Qlik script PostgreSQL pgvector embedding transformer token batch "
+    "hızlı yavaş büyük küçük yeni eski önemli gerekli mümkün farklı aynı"
+).split()
+
+def percentile(values: list[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+def make_texts(count: int, words: int, seed: int) -> list[str]:
+    """Her çalıştırmada farklı (cache'e takılmayan) ama tekrarlanabilir metinler"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(words)) for _ in range(count)]
+
+def set_torch_threads(threads: int) -> bool:
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        return True
+    except ImportError:
+        return False
+
+def bench_single(texts: list[str]) -> dict:
+    """Her metin için ayrı generate_embedding çağrısı"""
+    latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        t0 = time.perf_counter()
+        embedding_service.generate_embedding(text)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - start
+    return {
+        "mode": "single",
+        "batch_size": 1,
+        "texts": len(texts),
+        "total_seconds": round(total, 4),
+        "texts_per_sec": round(len(texts) / total, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3)
+    }
+
+def bench_batch(texts: list[str], batch_size: int) -> dict:
+    """
+    batch_size'lık gruplarla toplu vektörleştirme (gecikme = batch başına). batch_size modele
+    de aynen verilir; generate_embeddings_batch EMBEDDING_ENCODE_BATCH_SIZE'a böldüğü için kullanılmaz.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        t0 = time.perf_counter()
+        for _ in embedding_service.iter_embeddings_batch(texts[offset:offset + batch_size], batch_size=batch_size):
+            pass
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - start
+    return {
+        "mode": "batch",
+        "batch_size": batch_size,
+        "texts": len(texts),
+        "total_seconds": round(total, 4),
+        "texts_per_sec": round(len(texts) / total, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "p50_ms_per_text": round(percentile(latencies, 50) / batch_size, 3)
+    }
+
+def run_benchmark(backends, batch_sizes, lengths, thread_counts, text_count) -> dict:
+    # Model hızını ölçüyoruz: cache ve micro-batching kuyruğu devre dışı
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.EMBEDDING_DISPATCHER_ENABLED = False
+
+    results = []
+    seed = 0
+    for requested in backends:
+        settings.EMBEDDING_BACKEND = requested
+        embedding_service.unload_model()
+        load_start = time.perf_counter()
+        embedding_service.warmup_model()
+        load_seconds = time.perf_counter() - load_start
+        # İstenen backend yüklenemezse torch'a düşülür; sonuçlar gerçekten yüklenen backend'le etiketlenir
+        backend = embedding_service.get_active_backend()
+        model_id = embedding_service.get_model_id()
+        if backend != requested:
+            print(f"[{requested}] yüklenemedi, {backend} ile ölçülüyor")
+
+        # Thread ayarı sadece torch için anlamlı (ONNX Runtime thread'leri oturum açılırken sabitlenir)
+        threads_to_test = thread_counts if backend == "torch" else [None]
+        for threads in threads_to_test:
+            if threads:
+                set_torch_threads(threads)
+
+            for words in lengths:
+                seed += 1
+                base = {
+                    "backend": backend,
+                    "requested_backend": requested,
+                    "model_id": model_id,
+                    "threads": threads,
+                    "text_words": words,
+                    "model_load_seconds": round(load_seconds, 3)
+                }
+                results.append({**base, **bench_single(make_texts(text_count, words, seed))})
+                print(f"[{backend} t={threads} w={words}] single: {results[-1]['texts_per_sec']} texts/sec")
+
+                for batch_size in batch_sizes:
+                    seed += 1
+                    results.append({**base, **bench_batch(make_texts(text_count, words, seed), batch_size)})
+                    print(f"[{backend} t={threads} w={words}] batch={batch_size}: {results[-1]['texts_per_sec']} texts/sec")
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "model_name": embedding_service.MODEL_NAME
+        },
+        "parameters": {
+            "backends": backends,
+            "batch_sizes": batch_sizes,
+            "text_words": lengths,
+            "threads": thread_counts,
+            "texts_per_run": text_count
+        },
+        "results": results
+    }
+
+def _result_key(result: dict) -> tuple:
+    return (result["backend"], result["threads"], result["text_words"], result["mode"], result["batch_size"])
+
+def compare_with_baseline(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Baseline'a göre texts/sec'i max_regression oranından fazla düşen konfigürasyonlar"""
+    previous = {_result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(_result_key(result))
+        if not old or not old["texts_per_sec"]:
+            continue
+        change = (result["texts_per_sec"] - old["texts_per_sec"]) / old["texts_per_sec"]
+        if change < -max_regression:
+            regressions.append(
+                f"{_result_key(result)}: {old['texts_per_sec']} -> {result['texts_per_sec']} texts/sec ({change:+.1%})"
+            )
+    return regressions
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--backends", default="torch", help="Virgülle ayrılmış: torch,onnx")
+    parser.add_argument("--batch-sizes", default="8,32,64", type=_int_list)
+    parser.add_argument("--lengths", default="16,64,256", type=_int_list, help="Metin başına kelime sayısı")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1), type=_int_list, help="Torch thread sayıları")
+    parser.add_argument("--texts", default=128, type=int, help="Her ölçümde kullanılacak metin sayısı")
+    parser.add_argument("--output", default="embedding_benchmark.json")
+    parser.add_argument("--baseline", help="Karşılaştırılacak önceki rapor (regresyon kontrolü)")
+    parser.add_argument("--max-regression", default=0.15, type=float)
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        backends=[b.strip() for b in args.backends.split(",") if b.strip()],
+        batch_sizes=args.batch_sizes,
+        lengths=args.lengths,
+        thread_counts=args.threads,
+        text_count=args.texts
+    )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Rapor yazıldı: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Throughput regresyonu:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("Regresyon yok.")
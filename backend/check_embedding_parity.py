@@ -0,0 +1,12 @@
+"""
+Embedding backend parity kontrolü
+Kullanım: EMBEDDING_BACKEND=onnx python check_embedding_parity.py
+"""
+from services.embedding_service import check_backend_parity
+import json
+import sys
+
+if __name__ == "__main__":
+    result = check_backend_parity()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["passed"] else 1)
@@ -26,6 +26,128 @@ class Settings(BaseSettings):
     OBSIDIAN_VAULT_PATH: str = "/app/obsidian_vault"
     OPENAI_API_KEY: Optional[str] = None
     
+    # Embedding Backend: "torch" (varsayılan) veya "onnx" (ONNX Runtime, CPU'da daha hızlı ve hafif)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_QUANTIZED: bool = True  # int8 quantize model (ARM64/AVX2 dosyası otomatik seçilir)
+    EMBEDDING_ONNX_FILE: Optional[str] = None  # Örn. "onnx/model_O3.onnx" (boşsa otomatik)
+    
+    # Cold-start: Modelleri startup'ta yükle ve ısıt (/api/health/ready hazır olunca 200 döner)
+    EMBEDDING_PRELOAD: bool = False
+    LLM_WARMUP: bool = False
+    WARMUP_RETRY_INITIAL_SECONDS: float = 5.0  # Isıtma başarısızsa (örn. Ollama henüz ayakta değil) tekrar deneme aralığı
+    WARMUP_RETRY_MAX_SECONDS: float = 300.0  # Aralık her denemede iki katına çıkar, en fazla bu kadar
+    
+    # Çok Turlu Sohbet
+    CHAT_HISTORY_TOKENS: int = 600  # Prompt'a metin olarak giren son mesajların bütçesi; daha eskiler özete girer
+    CHAT_CONTEXT_MAX_TOKENS: int = 3072  # Ollama context'i bunu geçince özet + son mesajlarla yeniden başlanır (bkz. chat_context_limit)
+    CHAT_RESPONSE_RESERVE_TOKENS: int = 512  # num_ctx'te prompt şablonu, soru ve cevap için bırakılan pay
+    CHAT_SUMMARY_MAX_TOKENS: int = 200
+    CHAT_REWRITE_FOLLOWUPS: bool = True  # Takip sorularını arama için tek başına anlaşılır soruya çevir
+    
+    # Semantik Cevap Cache'i (benzer soru + aynı kaynak dokümanlar -> LLM çağrılmadan cevap)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MIN_SIMILARITY: float = 0.92  # Soru vektörleri arasındaki en düşük cosine benzerliği
+    ANSWER_CACHE_MAX_ENTRIES: int = 5000
+    ANSWER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    
+    # LLM (Ollama) - paylaşılan async istemci
+    OLLAMA_HOST: str = "http://localhost:11434"
+    OLLAMA_MODEL: str = "llama3"
+    OLLAMA_KEEP_ALIVE: str = "30m"  # Model son istekten bu kadar sonra bellekten atılır ("-1" = hiç)
+    OLLAMA_NUM_CTX: int = 8192  # Model context penceresi; her istekte aynı değer gider (farklı değer modeli yeniden yükletir)
+    OLLAMA_TIMEOUT_SECONDS: float = 120.0
+    OLLAMA_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    OLLAMA_MAX_CONCURRENCY: int = 1  # Model başına aynı anda çalışan üretim (CPU'da 1 önerilir)
+    OLLAMA_QUEUE_TIMEOUT_SECONDS: float = 60.0  # Sırada bundan uzun bekleyen istek hata alır
+    OLLAMA_MAX_CONNECTIONS: int = 10
+    
+    # Embedding Cache (aynı metni tekrar vektörleştirmemek için)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 50000
+    
+    # Sorgu Embedding Cache (tekrarlanan sorular modeli hiç çalıştırmaz, process içi LRU)
+    QUERY_CACHE_MAX_SIZE: int = 1024
+    QUERY_CACHE_TTL_SECONDS: int = 3600
+    
+    # Toplu Embedding (uzunluğa göre gruplanmış batch'ler, büyük girdilerde akış penceresi)
+    EMBEDDING_ENCODE_BATCH_SIZE: int = 32
+    EMBEDDING_STREAM_WINDOW: int = 512
+    
+    # Embedding Micro-Batching (eşzamanlı istekler tek forward pass'te birleştirilir)
+    EMBEDDING_DISPATCHER_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: int = 10
+    
+    # Chunking (uzun dokümanlar token bazlı, örtüşen parçalara bölünür)
+    CHUNK_SIZE_TOKENS: int = 200  # all-MiniLM-L6-v2 max_seq_length = 256 (başlık için pay bırakıldı)
+    CHUNK_OVERLAP_TOKENS: int = 40
+    RAG_CHUNKS_PER_DOCUMENT: int = 2  # LLM'e doküman başına gönderilecek en fazla parça
+    RAG_MIN_SIMILARITY: float = 0.3  # Bu cosine benzerliğinin altındaki parçalar LLM'e gönderilmez
+    RAG_SIMILARITY_MARGIN: float = 0.15  # En iyi sonuçtan bu kadar geride kalanlar da elenir (adaptive k)
+    
+    # Toplu arama (/api/search/batch): tek embedding batch'i + tek SQL sorgusu
+    SEARCH_BATCH_MAX_QUERIES: int = 256
+    SEARCH_BATCH_MAX_LIMIT: int = 50  # Sorgu başına en fazla sonuç
+    
+    # LLM Context: aday parçalardan token bütçesi içinde MMR ile (alakalı + birbirini tekrar etmeyen) seçim
+    CONTEXT_MAX_TOKENS: int = 1500
+    CONTEXT_MAX_DOCUMENTS: int = 5
+    CONTEXT_CANDIDATES: int = 30
+    CONTEXT_MMR_LAMBDA: float = 0.7  # 1 = sadece alaka, 0 = sadece çeşitlilik
+    CONTEXT_DUPLICATE_SIMILARITY: float = 0.95  # Seçilmiş bir parçaya bundan benzer parçalar hiç alınmaz
+    
+    # Cross-Encoder Rerank (opsiyonel): geniş aday kümesi tek batch'te yeniden puanlanır, en iyileri LLM'e gider
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Çok dilli (Türkçe dahil), CPU'da hafif
+    RERANK_MAX_LENGTH: int = 512
+    RERANK_CANDIDATES: int = 30
+    RERANK_CONTEXT_TOKENS: int = 1200  # Seçilen parçaların toplam token bütçesi
+    RERANK_CACHE_MAX_SIZE: int = 4096  # (soru, parça) skor cache'i
+    
+    # Arama Modu: "hybrid" (vektör + Türkçe full-text, Reciprocal Rank Fusion) veya "vector"
+    RETRIEVAL_MODE: str = "hybrid"
+    HYBRID_CANDIDATES: int = 50  # Her sıralamadan (vektör / full-text) alınacak aday sayısı
+    HYBRID_RRF_K: int = 60  # RRF sabiti: büyük = alt sıralardaki sonuçlar daha fazla katkı verir
+    HYBRID_LEXICAL_KEEP_RANK: int = 3  # Full-text sıralamasında ilk N parça benzerlik eşiğinden muaf (örn. SAP kodu)
+    
+    # Vektör Depolama: "full" (float32 tam tarama), "halfvec" (float16) veya "binary" (bit) ilk tarama
+    # halfvec/binary: quantize index'te aday bulunur, adaylar tam vektörle yeniden sıralanır
+    # (pgvector >= 0.7 ve migrate_vector_quantization.py gerekir)
+    VECTOR_STORAGE_MODE: str = "full"
+    VECTOR_RERANK_CANDIDATES: int = 100  # İlk taramadan alınacak en az aday sayısı
+    
+    # Vektör Arama Motoru: "pgvector", "local" (NumPy, memory-mapped dosya) veya "auto" (pgvector yoksa local)
+    VECTOR_SEARCH_BACKEND: str = "auto"
+    LOCAL_VECTOR_INDEX_DIR: str = "./data/vector_index"
+    
+    # ANN Vektör Index'i (startup'ta oluşturulur/ayar değişince yeniden kurulur)
+    VECTOR_INDEX_TYPE: str = "hnsw"  # "hnsw", "ivfflat" veya "none" (tam tarama)
+    VECTOR_INDEX_AUTO_CREATE: bool = True
+    VECTOR_DISTANCE: str = "cosine"  # "cosine" veya "inner_product" (vektörler normalize, aynı sıralama)
+    HNSW_M: int = 16
+    HNSW_EF_CONSTRUCTION: int = 64
+    HNSW_EF_SEARCH: int = 64  # Sorgu anı (en az sorgunun LIMIT'i kadar kullanılır): büyük = daha yüksek recall, daha yavaş
+    HNSW_FILTERED_EF_SEARCH: int = 400  # Metadata filtreli aramalarda (filtre index taramasından sonra uygulanır)
+    IVFFLAT_LISTS: int = 0  # 0 = otomatik (satır sayısı / 1000)
+    IVFFLAT_PROBES: int = 10
+    IVFFLAT_FILTERED_PROBES: int = 40
+    
+    # Arka Plan İndeksleyici (processing durumundaki dokümanlar)
+    BACKGROUND_INDEXER_ENABLED: bool = True
+    INDEXER_BATCH_SIZE: int = 16
+    INDEXER_POLL_INTERVAL_SECONDS: int = 30
+    INDEXER_MAX_ATTEMPTS: int = 8  # Geçici hatalarda (model yüklenemedi, OOM, DB) bu kadar denemeden sonra error'a çekilir
+    INDEXER_RETRY_BASE_SECONDS: int = 60  # Tekrar deneme aralığı: base * 2^(deneme-1)
+    
+    # RSS Zamanlayıcı (aktif feed'ler arka planda yenilenir; worker'lardan aynı anda sadece biri çalıştırır)
+    RSS_SCHEDULER_ENABLED: bool = True
+    RSS_REFRESH_INTERVAL_SECONDS: int = 900  # Bir feed en fazla bu sıklıkta çekilir
+    RSS_SCHEDULER_TICK_SECONDS: int = 60  # Zamanı gelen feed'ler bu aralıkla kontrol edilir
+    RSS_MAX_CONCURRENCY: int = 16  # Aynı anda çekilen feed sayısı
+    RSS_PER_HOST_CONCURRENCY: int = 2  # Aynı sunucudan aynı anda çekilen feed sayısı
+    RSS_FETCH_TIMEOUT_SECONDS: float = 20.0
+    RSS_MAX_BACKOFF_EXPONENT: int = 4  # Hatalı feed'ler interval * 2^hata (en fazla 2^4) sonra tekrar denenir
+    
     class Config:
         env_file = ".env"
         # .env dosyasını parent directory'de ara (Docker dışında çalışırken)
@@ -42,6 +164,15 @@ class Settings(BaseSettings):
         password_encoded = urllib.parse.quote_plus(self.POSTGRES_PASSWORD)
         return f"postgresql://{self.POSTGRES_USER}:{password_encoded}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def chat_context_limit(self) -> int:
+        """
+        Yeniden kullanılacak Ollama context'inin üst sınırı: yeni turun parçaları ve cevabı
+        OLLAMA_NUM_CTX'e sığmalı, yoksa Ollama context'in başını sessizce keser.
+        """
+        turn_tokens = max(self.CONTEXT_MAX_TOKENS, self.RERANK_CONTEXT_TOKENS) + self.CHAT_RESPONSE_RESERVE_TOKENS
+        return max(0, min(self.CHAT_CONTEXT_MAX_TOKENS, self.OLLAMA_NUM_CTX - turn_tokens))
+
 @lru_cache()
 def get_settings():
     return Settings()
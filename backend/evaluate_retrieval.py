@@ -0,0 +1,321 @@
+"""
+Retrieval kalite / gecikme değerlendirmesi
+Mevcut korpustan etiketli bir sorgu seti üretir (doküman başlığı ve parçalardan alınan
+kelime pencereleri; doğru cevap = kaynak doküman) ve search_similar_documents'ı farklı
+konfigürasyonlarda çalıştırır: tam tarama (exact), farklı ef_search/probes değerleriyle
+ANN index, hybrid ve rerank. Her konfigürasyon için recall@k, MRR, exact aramayla örtüşme
+ve p50/p99 gecikme JSON rapora yazılır. Sonuçlar uygulamadaki gibidir (RAG_MIN_SIMILARITY
+eşiği dahil); sorgu embedding'i bir kez hesaplanır, gecikmeye dahil değildir.
+Uygulama ef_search'ü index taramasının LIMIT'inden küçük tutmadığı için her konfigürasyonun
+etkin ef_search/probes değeri de raporlanır; etkin değeri öncekiyle aynı olan ANN konfigürasyonu
+tekrar ölçülmez.
+
+Kullanım:
+    python evaluate_retrieval.py --documents 200 --ef-search 16,40,64,128 --output retrieval_eval.json
+    python evaluate_retrieval.py --queries retrieval_eval.json --baseline retrieval_eval.json
+        # Aynı sorgu setiyle; recall/MRR düşerse veya gecikme çok artarsa exit code 1
+"""
+from config import settings
+from database import SessionLocal
+from models import Document, DocumentChunk
+from services import embedding_service, local_vector_index
+from services.rag_service import search_similar_documents
+from services.vector_index import index_type
+from sqlalchemy import select, func, text
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+import os
+
+CONFIG_NAMES = ("exact", "ann", "hybrid", "rerank")
+
+def percentile(values: list[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+@contextmanager
+def override_settings(**values):
+    """Konfigürasyon boyunca settings değerlerini değiştirir, sonra geri alır"""
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+# --- Sorgu seti ---
+
+def build_query_set(db, documents: int, words: int, seed: int) -> list[dict]:
+    """
+    Rastgele (tekrarlanabilir) seçilen parçalı dokümanlardan sorgular:
+    başlık (kısa, anahtar kelime ağırlıklı) ve parçadan words kelimelik pencere (pasaj).
+    """
+    rng = random.Random(seed)
+    candidates = db.execute(
+        select(Document.id, Document.title)
+        .where(Document.id.in_(select(DocumentChunk.document_id)))
+        .order_by(Document.id)
+    ).all()
+    sample = rng.sample(candidates, min(documents, len(candidates)))
+
+    queries = []
+    for document_id, title in sample:
+        if title and len(title.split()) >= 2:
+            queries.append({"type": "title", "query": title.strip(), "relevant": [document_id]})
+
+        chunks = db.execute(
+            select(DocumentChunk.content)
+            .where(DocumentChunk.document_id == document_id)
+            .order_by(DocumentChunk.chunk_index)
+        ).scalars().all()
+        tokens = rng.choice(chunks).split() if chunks else []
+        if len(tokens) >= 4:
+            start = rng.randrange(max(1, len(tokens) - words + 1))
+            queries.append({"type": "passage", "query": " ".join(tokens[start:start + words]), "relevant": [document_id]})
+    return queries
+
+# --- Konfigürasyonlar ---
+
+def build_configs(names: list[str], ef_search: list[int], probes: list[int]) -> list[dict]:
+    """
+    Çalıştırılacak konfigürasyonlar: {"name", "settings", "rerank", "exact", "sweep"}.
+    exact: index kapalı, tam vektörle sıralı tarama (diğerleri bununla karşılaştırılır).
+    sweep: ef_search/probes taraması (etkin değeri aynı olanlardan sadece ilki ölçülür).
+    """
+    configs = []
+    local = local_vector_index.is_enabled()
+    if "exact" in names:
+        # Local NumPy index'i zaten tam tarama yapar
+        configs.append({
+            "name": "exact",
+            "settings": {"RETRIEVAL_MODE": "vector", "VECTOR_STORAGE_MODE": "full"},
+            "rerank": False,
+            "exact": not local,
+            "sweep": False
+        })
+    if "ann" in names and not local:
+        kind = index_type()
+        if kind == "hnsw":
+            for value in ef_search:
+                configs.append({
+                    "name": f"hnsw_ef{value}",
+                    "settings": {"RETRIEVAL_MODE": "vector", "HNSW_EF_SEARCH": value},
+                    "rerank": False,
+                    "exact": False,
+                    "sweep": True
+                })
+        elif kind == "ivfflat":
+            for value in probes:
+                configs.append({
+                    "name": f"ivfflat_probes{value}",
+                    "settings": {"RETRIEVAL_MODE": "vector", "IVFFLAT_PROBES": value},
+                    "rerank": False,
+                    "exact": False,
+                    "sweep": True
+                })
+    if "hybrid" in names:
+        configs.append({"name": "hybrid", "settings": {"RETRIEVAL_MODE": "hybrid"}, "rerank": False, "exact": False, "sweep": False})
+    if "rerank" in names:
+        configs.append({"name": "rerank", "settings": {}, "rerank": True, "exact": False, "sweep": False})
+    return configs
+
+def _effective_ann_settings(db) -> dict:
+    """Mevcut transaction'daki ANN ayarları (apply_search_settings'in SET LOCAL ile verdiği gerçek değerler)"""
+    kind = index_type()
+    if kind == "hnsw":
+        return {"hnsw.ef_search": int(db.execute(text("SHOW hnsw.ef_search")).scalar())}
+    if kind == "ivfflat":
+        return {"ivfflat.probes": int(db.execute(text("SHOW ivfflat.probes")).scalar())}
+    return {}
+
+def _search(db, config: dict, item: dict, vector: list, limit: int, probe: bool = False):
+    """
+    Tek sorgu; her sorgu kendi transaction'ında (SET LOCAL ayarları sızmasın).
+    probe ise (sonuçlar, etkin ANN ayarları) döner.
+    """
+    try:
+        if config["exact"]:
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+        hits = search_similar_documents(db, item["query"], limit=limit, query_vector=vector, rerank=config["rerank"])
+        ids = [hit["id"] for hit in hits]
+        return (ids, _effective_ann_settings(db)) if probe else ids
+    finally:
+        db.rollback()
+
+def probe_config(db, config: dict, queries: list[dict], vectors: list, limit: int) -> dict:
+    """İlk sorguyu çalıştırır (model yükleme/plan cache'i; ölçülmez) ve etkin ANN ayarlarını döner"""
+    if not queries:
+        return {}
+    with override_settings(**config["settings"]):
+        return _search(db, config, queries[0], vectors[0], limit, probe=True)[1]
+
+def run_config(db, config: dict, queries: list[dict], vectors: list, limit: int, k_values: list[int], exact_results: list = None) -> tuple:
+    with override_settings(**config["settings"]):
+        results = []
+        latencies = []
+        for item, vector in zip(queries, vectors):
+            t0 = time.perf_counter()
+            results.append(_search(db, config, item, vector, limit))
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    metrics = {"name": config["name"], "settings": config["settings"], "rerank": config["rerank"], "queries": len(queries)}
+    metrics.update(score_results(queries, results, k_values))
+    metrics["by_type"] = {
+        query_type: score_results(
+            [item for item in queries if item["type"] == query_type],
+            [result for item, result in zip(queries, results) if item["type"] == query_type],
+            k_values
+        )
+        for query_type in sorted({item["type"] for item in queries})
+    }
+    if exact_results is not None:
+        # ANN index'in tam taramayla aynı dokümanları bulma oranı (etiketten bağımsız)
+        overlaps = [
+            len(set(result) & set(exact)) / len(exact)
+            for result, exact in zip(results, exact_results) if exact
+        ]
+        metrics["exact_overlap"] = round(float(np.mean(overlaps)), 4) if overlaps else None
+    metrics.update({
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(float(np.mean(latencies)), 3) if latencies else 0.0
+    })
+    return metrics, results
+
+def score_results(queries: list[dict], results: list[list[str]], k_values: list[int]) -> dict:
+    """recall@k (ilgili dokümanın ilk k sonuçta olması) ve MRR"""
+    ranks = []
+    for item, result in zip(queries, results):
+        relevant = set(item["relevant"])
+        ranks.append(next((position for position, document_id in enumerate(result, start=1) if document_id in relevant), None))
+
+    count = len(ranks) or 1
+    scores = {f"recall@{k}": round(sum(1 for rank in ranks if rank and rank <= k) / count, 4) for k in k_values}
+    scores["mrr"] = round(sum(1.0 / rank for rank in ranks if rank) / count, 4)
+    return scores
+
+def run_evaluation(queries: list[dict], configs: list[dict], limit: int, k_values: list[int]) -> dict:
+    db = SessionLocal()
+    try:
+        document_count = db.query(func.count(Document.id)).scalar()
+        chunk_count = db.query(func.count(DocumentChunk.id)).scalar()
+
+        # Sorgu embedding'i her konfigürasyonda aynı: bir kez hesaplanır, gecikmeye dahil edilmez
+        vectors = embedding_service.generate_query_embeddings_batch([item["query"] for item in queries])
+
+        reports = []
+        exact_results = None
+        swept = {}  # Etkin ANN ayarı -> o ayarla ölçülen sweep konfigürasyonu
+        for config in configs:
+            effective = probe_config(db, config, queries, vectors, limit)
+            effective_text = " ".join(f"{name}={value}" for name, value in effective.items())
+            if config["sweep"]:
+                key = json.dumps(effective, sort_keys=True)
+                if key in swept:
+                    print(f"[{config['name']}] atlandı: etkin ayar ({effective_text}) {swept[key]} ile aynı")
+                    continue
+                swept[key] = config["name"]
+
+            metrics, results = run_config(db, config, queries, vectors, limit, k_values, exact_results)
+            metrics["effective_settings"] = effective
+            if config["name"] == "exact":
+                exact_results = results
+            reports.append(metrics)
+            print(
+                f"[{config['name']}] recall@{k_values[-1]}={metrics[f'recall@{k_values[-1]}']} "
+                f"mrr={metrics['mrr']} p50={metrics['p50_ms']}ms p99={metrics['p99_ms']}ms {effective_text}".rstrip()
+            )
+    finally:
+        db.close()
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "model_id": embedding_service.get_model_id(),
+            "vector_backend": "local" if local_vector_index.is_enabled() else "pgvector",
+            "index_type": index_type(),
+            "storage_mode": settings.VECTOR_STORAGE_MODE,
+            "distance": settings.VECTOR_DISTANCE,
+            "documents": document_count,
+            "chunks": chunk_count
+        },
+        "parameters": {"limit": limit, "k": k_values},
+        "queries": queries,
+        "results": reports
+    }
+
+def compare_with_baseline(report: dict, baseline: dict, max_quality_drop: float, max_latency_regression: float) -> list[str]:
+    """Baseline'a göre recall/MRR'ı max_quality_drop'tan, p50'si max_latency_regression oranından fazla kötüleşenler"""
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        for metric in [f"recall@{k}" for k in report["parameters"]["k"]] + ["mrr"]:
+            if metric in old and result[metric] < old[metric] - max_quality_drop:
+                regressions.append(f"{result['name']} {metric}: {old[metric]} -> {result[metric]}")
+        if old["p50_ms"] and (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] > max_latency_regression:
+            regressions.append(f"{result['name']} p50: {old['p50_ms']} -> {result['p50_ms']} ms")
+    return regressions
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval kalite / gecikme değerlendirmesi")
+    parser.add_argument("--configs", default=",".join(CONFIG_NAMES), help="Virgülle ayrılmış: exact,ann,hybrid,rerank")
+    parser.add_argument("--ef-search", default="16,40,64,128", type=_int_list, help="HNSW index'inde denenecek ef_search değerleri")
+    parser.add_argument("--probes", default="1,5,10,20", type=_int_list, help="IVFFlat index'inde denenecek probes değerleri")
+    parser.add_argument("--documents", default=200, type=int, help="Sorgu üretilecek doküman sayısı")
+    parser.add_argument("--query-words", default=12, type=int, help="Pasaj sorgusu kelime sayısı")
+    parser.add_argument("--seed", default=42, type=int)
+    parser.add_argument("--queries", help="Sorgu setini bu rapordan al (farklı çalıştırmalar aynı setle karşılaştırılır)")
+    parser.add_argument("--limit", default=10, type=int, help="Sorgu başına istenen doküman sayısı")
+    parser.add_argument("--k", default="1,3,5,10", type=_int_list, help="recall@k için k değerleri")
+    parser.add_argument("--output", default="retrieval_eval.json")
+    parser.add_argument("--baseline", help="Karşılaştırılacak önceki rapor (regresyon kontrolü)")
+    parser.add_argument("--max-quality-drop", default=0.02, type=float, help="recall/MRR için izin verilen mutlak düşüş")
+    parser.add_argument("--max-latency-regression", default=0.25, type=float, help="p50 için izin verilen oransal artış")
+    args = parser.parse_args()
+
+    k_values = sorted(k for k in args.k if k <= args.limit) or [args.limit]
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = json.load(f)["queries"]
+    else:
+        db = SessionLocal()
+        try:
+            queries = build_query_set(db, args.documents, args.query_words, args.seed)
+        finally:
+            db.close()
+    if not queries:
+        print("Sorgu üretilemedi: parçalanmış doküman yok.")
+        sys.exit(1)
+
+    configs = build_configs([name.strip() for name in args.configs.split(",")], args.ef_search, args.probes)
+    report = run_evaluation(queries, configs, args.limit, k_values)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Rapor yazıldı: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_quality_drop, args.max_latency_regression)
+        if regressions:
+            print("Retrieval regresyonu:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("Regresyon yok.")
@@ -0,0 +1,36 @@
+"""
+Gunicorn ayarları (production)
+Kullanım: gunicorn main:app -c gunicorn.conf.py
+
+GUNICORN_PRELOAD=true ise uygulama ve embedding modeli master process'te bir kez
+yüklenir; fork edilen worker'lar model ağırlıklarını copy-on-write olarak paylaşır
+(4 worker için 4 ayrı kopya yerine tek kopya, worker başına model yükleme süresi yok).
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+def when_ready(server):
+    """Master process: worker'lar fork edilmeden önce modeli belleğe al"""
+    if not preload_app:
+        return
+    
+    from config import settings
+    # ONNX Runtime oturumu oluşturulurken thread havuzu açar, fork sonrası güvenli değil.
+    # Torch'ta sadece ağırlıklar yüklenir; inference (warm-up) her worker'da yapılır,
+    # çünkü OpenMP thread havuzu da fork sonrasına taşınamaz.
+    if (settings.EMBEDDING_BACKEND or "torch").lower() != "torch":
+        server.log.info(f"Master preload atlandı ({settings.EMBEDDING_BACKEND} backend fork-safe değil)")
+        return
+    
+    from services.embedding_service import get_model
+    get_model()
+    server.log.info("Embedding modeli master process'te yüklendi (worker'lar paylaşacak).")
+
+def post_fork(server, worker):
+    # Master'da açılmış DB bağlantıları worker'lar arasında paylaşılmasın
+    from database import engine
+    engine.dispose(close=False)
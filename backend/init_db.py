@@ -28,6 +28,10 @@ def init_database():
             # Tabloları oluştur
             Base.metadata.create_all(bind=engine)
             print("Tables created successfully!")
+            
+            # ANN vektör index'leri (HNSW/IVFFlat, config.Settings'e göre)
+            from services.vector_index import ensure_vector_indexes
+            ensure_vector_indexes()
             return
             
         except OperationalError as e:
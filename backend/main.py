@@ -7,7 +7,9 @@ from config import settings
 
 print(f"Project: {settings.PROJECT_NAME}, Version: {settings.VERSION}")
 print(f"OBSIDIAN_VAULT_PATH: {settings.OBSIDIAN_VAULT_PATH}")
+from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from typing import List
@@ -17,17 +19,24 @@ import os
 
 logger = logging.getLogger(__name__)
 
-from database import get_db, engine, Base
+from database import get_db, engine, Base, SessionLocal
 from models import Document, Source, Activity, DocumentStatus, SourceStatus, ActivityType, SourceType, RSSFeed, Article, ArticleStatus, Category
 from schemas import (
     StatItem, DocumentSchema, SourceSchema, ActivitySchema,
     RSSFeedSchema, ArticlePreviewSchema, ArticleDetailSchema,
     AddRSSFeedRequest, AddLinkRequest, SaveArticleRequest,
-    ChatRequest, ChatResponse, CategorySchema, AddCategoryRequest
+    ChatRequest, ChatResponse, CategorySchema, AddCategoryRequest,
+    BatchSearchRequest, BatchSearchResponse
 )
 from utils import format_time_ago, format_file_size, generate_safe_filename
-from services.embedding_service import generate_embedding
-from services.rag_service import chat_with_data
+from services.indexing_service import run_background_indexer, notify_indexer
+from services.embedding_cache import compute_content_hash
+from services.rag_service import chat_with_data, stream_chat_with_data, warmup_llm, is_llm_ready, batch_search
+from services.embedding_service import warmup_model, is_model_ready, get_embedding_metrics, generate_query_embeddings_batch
+from services.vector_index import ensure_vector_indexes
+from services import local_vector_index, llm_client, rss_service
+from services.answer_cache import get_answer_cache_stats
+from services.rerank_service import score_passages, get_rerank_stats
 import feedparser
 import requests
 from bs4 import BeautifulSoup
@@ -55,11 +64,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _ensure_vector_indexes():
+    try:
+        ensure_vector_indexes()
+    except Exception as e:
+        logger.error(f"Vektör index'i oluşturulamadı: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Uygulama başladığında çalışacak kodlar"""
     logger.info("Uygulama başlatılıyor...")
     
+    if settings.chat_context_limit < settings.CHAT_CONTEXT_MAX_TOKENS:
+        logger.warning(
+            f"CHAT_CONTEXT_MAX_TOKENS ({settings.CHAT_CONTEXT_MAX_TOKENS}) OLLAMA_NUM_CTX ({settings.OLLAMA_NUM_CTX}) "
+            f"içine sığmıyor; sohbet context'i {settings.chat_context_limit} token ile sınırlandı."
+        )
+    
     # Veritabanı tablolarını oluştur (eğer yoksa) ve pgvector extension'ı aktif et
     try:
         from sqlalchemy import text
@@ -86,6 +107,34 @@ async def startup_event():
                     migrate_add_category_id()
                 except Exception as e:
                     logger.warning(f"Migration uyarısı: {e}")
+                
+                # Migration: full-text arama kolonları (hibrit arama)
+                try:
+                    from migrate_search_vector import migrate_search_vector
+                    migrate_search_vector()
+                except Exception as e:
+                    logger.warning(f"Migration uyarısı: {e}")
+                
+                # Migration: doc_metadata -> JSONB (metadata filtreleri)
+                try:
+                    from migrate_doc_metadata_jsonb import migrate_doc_metadata_jsonb
+                    migrate_doc_metadata_jsonb()
+                except Exception as e:
+                    logger.warning(f"Migration uyarısı: {e}")
+                
+                # Migration: rss_feeds çekme istatistikleri (arka plan RSS zamanlayıcısı)
+                try:
+                    from migrate_rss_feed_stats import migrate_rss_feed_stats
+                    migrate_rss_feed_stats()
+                except Exception as e:
+                    logger.warning(f"Migration uyarısı: {e}")
+                
+                # Migration: documents indeksleme denemeleri (geçici hatalarda tekrar deneme)
+                try:
+                    from migrate_document_index_retry import migrate_document_index_retry
+                    migrate_document_index_retry()
+                except Exception as e:
+                    logger.warning(f"Migration uyarısı: {e}")
                     
                 break # Başarılı olursa döngüden çık
                 
@@ -101,11 +150,100 @@ async def startup_event():
                 
     except Exception as e:
         logger.error("Startup kritik hata")
+    
+    import asyncio
+    
+    # ANN vektör index'lerini ayarlarla eşitle (büyük tablolarda uzun sürebilir, istekleri bekletmez)
+    if settings.VECTOR_INDEX_AUTO_CREATE and not local_vector_index.is_enabled():
+        asyncio.get_running_loop().run_in_executor(None, _ensure_vector_indexes)
+    
+    # pgvector yoksa local vektör index'ini yükle (gerekirse veritabanından kur)
+    if local_vector_index.is_enabled():
+        asyncio.get_running_loop().run_in_executor(None, local_vector_index.get_local_index)
+    
+    # processing durumundaki dokümanları arka planda indeksle
+    if settings.BACKGROUND_INDEXER_ENABLED:
+        asyncio.create_task(run_background_indexer())
+    
+    # Aktif RSS feed'lerini arka planda yenile (worker'lardan aynı anda sadece biri)
+    if settings.RSS_SCHEDULER_ENABLED:
+        asyncio.create_task(rss_service.run_rss_scheduler())
+    
+    # Opsiyonel: Modelleri ilk istekten önce yükle ve ısıt (readiness endpoint'i bunu bekler)
+    if settings.EMBEDDING_PRELOAD or settings.LLM_WARMUP:
+        asyncio.create_task(warmup_models())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ollama ve RSS bağlantı havuzlarını kapat
+    await llm_client.close_client()
+    await rss_service.close_client()
+
+async def _warmup_with_retry(name: str, warmup):
+    """
+    Isıtma başarılı olana kadar artan aralıklarla (WARMUP_RETRY_*) tekrar dener; böylece
+    Ollama geç ayağa kalksa da readiness process ömrü boyunca 503'te kalmaz.
+    """
+    import asyncio
+    delay = settings.WARMUP_RETRY_INITIAL_SECONDS
+    while True:
+        try:
+            await warmup()
+            return
+        except Exception as e:
+            logger.error(f"{name} ısıtılamadı, {delay:.0f} sn sonra tekrar denenecek: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+
+async def warmup_models():
+    """Embedding modelini ve LLM'i arka planda (birbirini beklemeden) ısıtır; event loop bloklanmaz"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    
+    async def warmup_embedding():
+        await _warmup_with_retry("Embedding modeli", lambda: loop.run_in_executor(None, warmup_model))
+        if settings.RERANK_ENABLED:
+            await _warmup_with_retry("Rerank modeli", lambda: loop.run_in_executor(None, score_passages, "TUYGUN", ["TUYGUN"]))
+    
+    warmups = []
+    if settings.EMBEDDING_PRELOAD:
+        warmups.append(warmup_embedding())
+    if settings.LLM_WARMUP:
+        warmups.append(_warmup_with_retry("LLM", warmup_llm))
+    await asyncio.gather(*warmups)
 
 @app.get("/")
 async def root():
     return {"message": "TUYGUN API is running", "version": "1.0.0"}
 
+@app.get("/api/health/ready")
+async def readiness():
+    """
+    Readiness kontrolü: Startup'ta ısıtılması istenen modeller hazır olana kadar 503 döner.
+    Model ısıtma yerine bir istekle yüklendiyse de hazır sayılır (ısıtma arka planda tekrar denenir).
+    (Preload kapalıysa modeller ilk istekte yüklenir, endpoint direkt hazır döner.)
+    """
+    checks = {}
+    if settings.EMBEDDING_PRELOAD:
+        checks["embedding_model"] = is_model_ready()
+    if settings.LLM_WARMUP:
+        checks["llm"] = is_llm_ready()
+    
+    ready = all(checks.values())
+    if not ready:
+        return JSONResponse(status_code=503, content={"ready": False, "checks": checks})
+    return {"ready": True, "checks": checks}
+
+@app.get("/api/metrics/embedding")
+async def embedding_metrics():
+    """Embedding/rerank/cevap cache'leri, micro-batching ve LLM kuyruğu metrikleri (istek hangi worker'a düştüyse onun değerleri)"""
+    return {
+        **get_embedding_metrics(),
+        "rerank": get_rerank_stats(),
+        "answer_cache": get_answer_cache_stats(),
+        "llm": llm_client.get_llm_stats()
+    }
+
 @app.get("/api/dashboard/stats", response_model=List[StatItem])
 async def get_stats(db: Session = Depends(get_db)):
     """Dashboard'daki istatistik kartları için veri döner"""
@@ -262,12 +400,18 @@ async def add_rss_feed(feed_data: AddRSSFeedRequest, db: Session = Depends(get_d
         if not feed_data.url or not feed_data.url.strip():
             raise HTTPException(status_code=400, detail="Feed URL gerekli")
         
-        # Feed'i parse et ve doğrula
+        # Feed'i indir, parse et ve doğrula (event loop bloklanmaz)
+        # Doğrulayıcılar (ETag/hash) burada saklanmaz: makaleler ilk çekmede eklenecek, o çekme atlanmamalı
         try:
-            parsed = feedparser.parse(feed_data.url)
+            import asyncio
+            response = await rss_service.download_feed(feed_data.url.strip())
+            parsed = await asyncio.get_running_loop().run_in_executor(None, rss_service.parse_feed, response)
             if parsed.bozo:
                 logger.warning(f"RSS feed parse uyarısı: {feed_data.url}")
                 # Bozo olsa bile devam et, bazı feed'ler bozo olabilir ama çalışır
+        except rss_service.FeedFetchError as fetch_error:
+            # Sunucu geçici olarak erişilemez olabilir; zamanlayıcı sonra tekrar dener
+            logger.warning(f"RSS feed indirilemedi: {feed_data.url} ({fetch_error})")
         except Exception as parse_error:
             logger.error(f"RSS feed parse hatası: {parse_error}")
             raise HTTPException(status_code=400, detail=f"RSS feed parse edilemedi: {str(parse_error)}")
@@ -341,7 +485,13 @@ async def get_rss_feeds(db: Session = Depends(get_db)):
                 "url": feed.url,
                 "category": feed.category_obj.name if feed.category_obj else (feed.category or None),
                 "is_active": feed.is_active == "true",
-                "last_fetched_at": feed.last_fetched_at.isoformat() if feed.last_fetched_at else None
+                "last_fetched_at": feed.last_fetched_at.isoformat() if feed.last_fetched_at else None,
+                "last_checked_at": feed.last_checked_at.isoformat() if feed.last_checked_at else None,
+                "last_fetch_duration_ms": feed.last_fetch_duration_ms,
+                "fetch_count": feed.fetch_count or 0,
+                "error_count": feed.error_count or 0,
+                "consecutive_errors": feed.consecutive_errors or 0,
+                "last_error": feed.last_error
             }
             for feed in feeds
         ]
@@ -426,54 +576,39 @@ async def fetch_rss_feed(feed_id: str, db: Session = Depends(get_db)):
         if not feed:
             raise HTTPException(status_code=404, detail="RSS feed bulunamadı")
         
-        # Feed'i parse et
-        parsed = feedparser.parse(feed.url)
-        if parsed.bozo:
+        # Feed'i indir (event loop bloklanmaz, conditional GET) ve parse et
+        import asyncio
+        started = time.perf_counter()
+        try:
+            response = await rss_service.download_feed(feed.url, feed.etag, feed.last_modified)
+            if rss_service.is_unchanged(response, feed.content_hash):
+                # Son çekmeden beri değişmedi: yeni makale yok
+                rss_service.record_fetch(feed, started)
+                db.commit()
+                return []
+            parsed = await asyncio.get_running_loop().run_in_executor(None, rss_service.parse_feed, response)
+            if parsed.bozo:
+                raise rss_service.FeedFetchError("RSS feed parse edilemedi")
+        except rss_service.FeedFetchError as fetch_error:
+            rss_service.record_fetch(feed, started, str(fetch_error))
+            db.commit()
             raise HTTPException(status_code=400, detail="RSS feed parse edilemedi")
         
-        articles = []
-        for entry in parsed.entries[:50]:  # İlk 50 makale
-            # Zaten var mı kontrol et
-            existing = db.query(Article).filter(Article.url == entry.link).first()
-            if existing:
-                continue
-            
-            # Yeni article oluştur (henüz scrape edilmedi, sadece başlık)
-            published_at = None
-            if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                try:
-                    published_at = datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
-                except:
-                    pass
-            
-            article = Article(
-                id=str(uuid.uuid4()),
-                feed_id=feed_id,
-                title=entry.title,
-                url=entry.link,
-                author=getattr(entry, 'author', None),
-                published_at=published_at,
-                status=ArticleStatus.pending
-            )
-            db.add(article)
-            articles.append(article)
-        
-        db.commit()
-        
-        # Feed'in last_fetched_at'ini güncelle
-        feed.last_fetched_at = datetime.now(timezone.utc)
+        # Yeni makaleleri ekle (henüz scrape edilmedi, sadece başlık) ve istatistikleri güncelle
+        articles = rss_service.store_entries(db, feed, parsed.entries)
+        rss_service.record_fetch(feed, started, validators=rss_service.feed_validators(response))
         db.commit()
         
         return [
             {
-                "id": article.id,
-                "feed_id": article.feed_id,
+                "id": article["id"],
+                "feed_id": article["feed_id"],
                 "feed_name": feed.name,
-                "title": article.title,
-                "url": article.url,
-                "author": article.author,
-                "published_at": article.published_at.isoformat() if article.published_at else None,
-                "status": article.status.value
+                "title": article["title"],
+                "url": article["url"],
+                "author": article["author"],
+                "published_at": article["published_at"].isoformat() if article["published_at"] else None,
+                "status": article["status"].value
             }
             for article in articles
         ]
@@ -533,7 +668,6 @@ async def preview_article(article_id: str, db: Session = Depends(get_db)):
         
         # 2. Ollama ile özetle
         try:
-            import ollama
             # Wikilink'leri teşvik eden prompt (Nöro-Mimari)
             prompt = f"""Sen bir Bilgi Mimarı'sın. Bu metni analiz et ve "İkinci Beyin" için hazırla.
 
@@ -550,10 +684,7 @@ KONULAR: [[Konu 1]], [[Konu 2]]
 Makale:
 {content_text}"""
             
-            ollama_response = ollama.generate(
-                model='llama3',
-                prompt=prompt
-            )
+            ollama_response = await llm_client.generate(prompt)
             response_text = ollama_response.get('response', '').strip()
             
             # Parser
@@ -642,14 +773,17 @@ async def save_article(article_id: str, save_data: SaveArticleRequest, db: Sessi
             source_id=rss_source.id,
             size=f"{len(article.content)} chars",
             size_bytes=len(article.content.encode('utf-8')),
-            embeddings_count=0,  # Embedding henüz oluşturulmadı
+            content=article.content,  # RAG için içerik
+            content_hash=compute_content_hash(article.content),
+            embeddings_count=0,  # Embedding arka plan indeksleyicisinde oluşturulur
             status=DocumentStatus.processing,
-            doc_metadata=json.dumps({
+            doc_metadata={
                 "url": article.url,
                 "author": article.author,
                 "published_at": article.published_at.isoformat() if article.published_at else None,
-                "category": save_data.category
-            })
+                "category": save_data.category,
+                "ai_summary": article.summary
+            }
         )
         db.add(document)
         
@@ -729,6 +863,9 @@ tags: [tuygun, imported, {save_data.category.split('/')[-1] if '/' in save_data.
         db.add(activity)
         db.commit()
         
+        # Vektörleştirme request dışında yapılır
+        notify_indexer()
+        
         return {"message": "Makale başarıyla kaydedildi", "article_id": article_id, "document_id": document.id}
     except HTTPException:
         raise
@@ -933,7 +1070,6 @@ async def preview_rss_article(request: dict):
         ai_tags = []
         
         try:
-            import ollama
             # Özet ve etiketleri tek seferde iste
             # Özet ve etiketleri tek seferde iste
             prompt = f"""Sen bir Bilgi Mimarı'sın (Information Architect). Görevin bu metni analiz edip Obsidian "İkinci Beyin" sistemine uygun hale getirmek.
@@ -952,10 +1088,7 @@ KONULAR: [[Konu 1]], [[Konu 2]], [[Konu 3]]
 Makale:
 {content_text}"""
             
-            ollama_response = ollama.generate(
-                model='llama3',
-                prompt=prompt
-            )
+            ollama_response = await llm_client.generate(prompt)
             response_text = ollama_response.get('response', '').strip()
             
             # Parse response
@@ -1041,17 +1174,6 @@ async def save_rss_article(request: dict, db: Session = Depends(get_db)):
             db.add(rss_source)
             db.commit()
         
-        # 3. Vektör oluştur (RAG için)
-        embedding_vector = None
-        try:
-            # İçeriği vektörleştir (özet + içerik birleşimi daha iyi sonuç verir)
-            text_for_embedding = f"{title}\n\n{ai_summary}\n\n{content[:2000]}"  # İlk 2000 karakter
-            embedding_vector = generate_embedding(text_for_embedding)
-            if embedding_vector:
-                logger.info(f"Embedding oluşturuldu: {len(embedding_vector)} boyutlu")
-        except Exception as e:
-            logger.warning(f"Embedding oluşturulamadı (devam ediliyor): {e}")
-        
         # Document oluştur
         document = Document(
             id=str(uuid.uuid4()),
@@ -1061,10 +1183,10 @@ async def save_rss_article(request: dict, db: Session = Depends(get_db)):
             size=f"{len(content)} chars",
             size_bytes=len(content.encode('utf-8')),
             content=content,  # RAG için içerik
-            embeddings_count=1 if embedding_vector else 0,
-            status=DocumentStatus.indexed if embedding_vector else DocumentStatus.processing,
-            embedding=embedding_vector,  # Vektörü kaydet
-            doc_metadata=json.dumps({
+            content_hash=compute_content_hash(content),  # Duplicate kontrolü / cache anahtarı
+            embeddings_count=0,  # Embedding arka plan indeksleyicisinde oluşturulur
+            status=DocumentStatus.processing,
+            doc_metadata={
                 "url": url,
                 "category": category,
                 "ai_summary": ai_summary,
@@ -1072,7 +1194,7 @@ async def save_rss_article(request: dict, db: Session = Depends(get_db)):
                 "ai_topics": ai_topics,
                 "rss_tags": rss_tags,
                 "all_tags": all_tags
-            })
+            }
         )
         db.add(document)
         
@@ -1153,6 +1275,9 @@ tags:
         db.add(activity)
         db.commit()
         
+        # 3. Parçalara bölme ve vektörleştirme (RAG için) arka plan indeksleyicisinde yapılır
+        notify_indexer()
+        
         return {
             "message": "Makale başarıyla kaydedildi",
             "document_id": document.id,
@@ -1171,6 +1296,44 @@ tags:
                 error_msg = "Bilinmeyen veritabanı hatası"
         raise HTTPException(status_code=500, detail=f"Makale kaydedilirken hata: {error_msg}")
 
+# ==================== SEARCH ENDPOINT ====================
+
+@app.post("/api/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest, db: Session = Depends(get_db)):
+    """
+    Toplu semantik arama (LLM çağrılmaz): sorgular tek batch'te vektörleştirilir,
+    tüm en yakın komşu aramaları tek SQL sorgusunda yapılır.
+    Her sorgu için doküman id'leri ve benzerlik skorları döner.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="En az bir sorgu gerekli")
+    if len(request.queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tek istekte en fazla {settings.SEARCH_BATCH_MAX_QUERIES} sorgu gönderilebilir"
+        )
+    if not 1 <= request.limit <= settings.SEARCH_BATCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit 1-{settings.SEARCH_BATCH_MAX_LIMIT} arasında olmalı")
+    
+    queries = [query.strip() for query in request.queries]
+    filters = request.filters.model_dump() if request.filters else None
+    try:
+        import asyncio
+        loop = asyncio.get_running_loop()
+        # Model ve sorgu event loop'u bloklamasın
+        vectors = await loop.run_in_executor(None, generate_query_embeddings_batch, queries)
+        hits = await loop.run_in_executor(None, batch_search, db, vectors, request.limit, filters)
+    except Exception as e:
+        logger.error(f"Toplu arama hatası: {e}")
+        raise HTTPException(status_code=500, detail=f"Arama hatası: {str(e)}")
+    
+    return {
+        "results": [
+            {"query": query, "hits": query_hits}
+            for query, query_hits in zip(request.queries, hits)
+        ]
+    }
+
 # ==================== RAG CHAT ENDPOINT ====================
 
 @app.post("/api/chat", response_model=ChatResponse)
@@ -1185,7 +1348,12 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Mesaj boş olamaz")
         
         # RAG servisini çağır
-        response = await chat_with_data(db, request.message.strip())
+        response = await chat_with_data(
+            request.message.strip(),
+            history=request.history,
+            state=request.conversation.model_dump() if request.conversation else None,
+            filters=request.filters.model_dump() if request.filters else None
+        )
         
         # Activity log ekle
         try:
@@ -1206,3 +1374,53 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
     except Exception as e:
         logger.error(f"Chat endpoint hatası: {e}")
         raise HTTPException(status_code=500, detail=f"Sohbet hatası: {str(e)}")
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    RAG Chat (Server-Sent Events): Önce kaynaklar, sonra Ollama ürettikçe token'lar,
+    en sonda cevap ve süre ölçümleri ("done") gönderilir.
+    Streaming desteklemeyen istemciler /api/chat kullanmaya devam eder.
+    """
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Mesaj boş olamaz")
+    message = request.message.strip()
+    state = request.conversation.model_dump() if request.conversation else None
+    filters = request.filters.model_dump() if request.filters else None
+    
+    async def event_stream():
+        # Dependency session'ı response başlamadan kapanır; stream kendi session'ını yönetir
+        db = SessionLocal()
+        try:
+            answer = ""
+            async for event, data in stream_chat_with_data(message, history=request.history, state=state, filters=filters):
+                if event == "done":
+                    answer = data.get("answer", "")
+                yield _sse_event(event, data)
+            
+            # Activity log ekle
+            try:
+                activity = Activity(
+                    id=str(uuid.uuid4()),
+                    type=ActivityType.query,
+                    title=f"Soru: {message[:50]}...",
+                    description=answer[:200]
+                )
+                db.add(activity)
+                db.commit()
+            except Exception as log_error:
+                logger.warning(f"Activity log hatası: {log_error}")
+        except Exception as e:
+            logger.error(f"Chat stream hatası: {e}")
+            yield _sse_event("error", {"message": f"Sohbet hatası: {str(e)}"})
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
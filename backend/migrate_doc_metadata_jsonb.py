@@ -0,0 +1,74 @@
+"""
+Migration: documents.doc_metadata kolonunu Text'ten JSONB'ye çevir ve metadata index'lerini ekle
+Kategori/etiket/URL artık SQL'de okunur ve filtrelenir (Python'da json.loads gerekmez).
+Geçersiz JSON içeren satırların metadata'sı NULL yapılır (log'a yazılır).
+"""
+from database import SessionLocal
+from sqlalchemy import text
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+METADATA_INDEXES = {
+    "ix_documents_doc_metadata": "USING gin (doc_metadata jsonb_path_ops)",
+    "ix_documents_metadata_category": "((doc_metadata ->> 'category'))",
+    "ix_documents_source_id": "(source_id)",
+    "ix_documents_created_at": "(created_at)"
+}
+
+def _clear_invalid_json(db):
+    """JSON olarak okunamayan metadata değerlerini NULL yapar (tip dönüşümü tek satır yüzünden düşmesin)"""
+    invalid = []
+    for document_id, value in db.execute(text(
+        "SELECT id, doc_metadata FROM documents WHERE doc_metadata IS NOT NULL"
+    )):
+        try:
+            json.loads(value)
+        except (TypeError, ValueError):
+            invalid.append(document_id)
+
+    if invalid:
+        logger.warning(f"{len(invalid)} dokümanın metadata'sı geçersiz JSON, NULL yapılıyor: {invalid[:10]}")
+        db.execute(
+            text("UPDATE documents SET doc_metadata = NULL WHERE id = ANY(:ids)"),
+            {"ids": invalid}
+        )
+
+def migrate_doc_metadata_jsonb():
+    """doc_metadata -> JSONB (henüz çevrilmediyse) ve index'ler"""
+    db = SessionLocal()
+    try:
+        data_type = db.execute(text("""
+            SELECT data_type
+            FROM information_schema.columns
+            WHERE table_name = 'documents' AND column_name = 'doc_metadata';
+        """)).scalar()
+
+        if data_type and data_type != "jsonb":
+            _clear_invalid_json(db)
+            # Tablo yeniden yazılır (büyük tablolarda biraz sürebilir)
+            db.execute(text("""
+                ALTER TABLE documents
+                ALTER COLUMN doc_metadata TYPE jsonb
+                USING nullif(btrim(doc_metadata), '')::jsonb;
+            """))
+            db.commit()
+            logger.info("documents.doc_metadata JSONB'ye çevrildi.")
+
+        for name, definition in METADATA_INDEXES.items():
+            db.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON documents {definition};"))
+        db.commit()
+
+        logger.info("Migration tamamlandı! (doc_metadata jsonb)")
+
+    except Exception as e:
+        logger.error(f"Migration hatası: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_doc_metadata_jsonb()
@@ -0,0 +1,68 @@
+"""
+Migration: Mevcut dokümanları parçalara bölüp document_chunks tablosuna indeksle
+(Eski kayıtlar sadece ilk 2000 karakterden üretilmiş tek bir vektöre sahip)
+"""
+from database import engine, Base, SessionLocal
+from models import Document, DocumentChunk
+from services.indexing_service import index_document
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+def migrate_document_chunks():
+    """İçeriği olup henüz parçası olmayan dokümanları indeksle"""
+    # document_chunks tablosunu oluştur (yoksa)
+    Base.metadata.create_all(bind=engine, tables=[DocumentChunk.__table__])
+    
+    db = SessionLocal()
+    try:
+        has_chunks = db.query(DocumentChunk.id).filter(
+            DocumentChunk.document_id == Document.id
+        ).exists()
+        
+        total = 0
+        failed_ids = []
+        # Hatalı ya da indekslenecek içeriği olmayan (parça üretmeyen) dokümanlar tekrar seçilmez
+        skipped_ids = []
+        while True:
+            documents = db.query(Document).filter(
+                Document.content.isnot(None),
+                ~has_chunks,
+                ~Document.id.in_(skipped_ids)
+            ).limit(BATCH_SIZE).all()
+            
+            if not documents:
+                break
+            
+            for document in documents:
+                try:
+                    with db.begin_nested():
+                        created = index_document(db, document)
+                    if created:
+                        total += 1
+                    else:
+                        skipped_ids.append(document.id)
+                except Exception as e:
+                    logger.error(f"Doküman indekslenemedi ({document.id}): {e}")
+                    failed_ids.append(document.id)
+                    skipped_ids.append(document.id)
+            
+            db.commit()
+            logger.info(f"{total} doküman parçalara bölündü...")
+        
+        logger.info(
+            f"Migration tamamlandı! {total} doküman indekslendi, {len(failed_ids)} hata, "
+            f"{len(skipped_ids) - len(failed_ids)} içeriksiz doküman atlandı."
+        )
+    except Exception as e:
+        logger.error(f"Migration hatası: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_document_chunks()
@@ -0,0 +1,36 @@
+"""
+Migration: documents tablosuna arka plan indeksleyicisinin tekrar deneme kolonlarını ekle
+(geçici hatayla biten dokümanlar processing'de kalır, artan aralıklarla tekrar denenir)
+"""
+from database import SessionLocal
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# kolon -> tanım (models.Document ile aynı)
+DOCUMENT_INDEX_RETRY_COLUMNS = {
+    "index_attempts": "INTEGER NOT NULL DEFAULT 0",
+    "next_index_at": "TIMESTAMP WITH TIME ZONE"
+}
+
+def migrate_document_index_retry():
+    """documents tekrar deneme kolonlarını ekle (yoksa)"""
+    db = SessionLocal()
+    try:
+        for column, definition in DOCUMENT_INDEX_RETRY_COLUMNS.items():
+            db.execute(text(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {column} {definition};"))
+        db.commit()
+
+        logger.info("Migration tamamlandı! (documents indeksleme denemeleri)")
+
+    except Exception as e:
+        logger.error(f"Migration hatası: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_document_index_retry()
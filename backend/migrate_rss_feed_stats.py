@@ -0,0 +1,43 @@
+"""
+Migration: rss_feeds tablosuna çekme istatistiği kolonlarını ekle
+(arka plan RSS zamanlayıcısı: son deneme, süre, hata sayıları; conditional GET doğrulayıcıları)
+"""
+from database import SessionLocal
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# kolon -> tanım (models.RSSFeed ile aynı)
+RSS_FEED_STATS_COLUMNS = {
+    "last_checked_at": "TIMESTAMP WITH TIME ZONE",
+    "last_fetch_duration_ms": "INTEGER",
+    "fetch_count": "INTEGER NOT NULL DEFAULT 0",
+    "error_count": "INTEGER NOT NULL DEFAULT 0",
+    "consecutive_errors": "INTEGER NOT NULL DEFAULT 0",
+    "last_error": "TEXT",
+    "etag": "VARCHAR",
+    "last_modified": "VARCHAR",
+    "content_hash": "VARCHAR(64)"
+}
+
+def migrate_rss_feed_stats():
+    """rss_feeds istatistik kolonlarını ekle (yoksa)"""
+    db = SessionLocal()
+    try:
+        for column, definition in RSS_FEED_STATS_COLUMNS.items():
+            db.execute(text(f"ALTER TABLE rss_feeds ADD COLUMN IF NOT EXISTS {column} {definition};"))
+        db.commit()
+
+        logger.info("Migration tamamlandı! (rss_feeds istatistikleri)")
+
+    except Exception as e:
+        logger.error(f"Migration hatası: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_rss_feed_stats()
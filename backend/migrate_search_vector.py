@@ -0,0 +1,56 @@
+"""
+Migration: documents ve document_chunks tablolarına full-text arama kolonu (search_vector) ekle
+Generated (STORED) tsvector kolonu mevcut satırlar için de otomatik doldurulur; GIN index ile aranır.
+"""
+from database import SessionLocal
+from models import TEXT_SEARCH_CONFIG
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tablo -> tsvector'a girecek ifade (models.py'deki Computed tanımlarıyla aynı)
+SEARCH_VECTOR_SOURCES = {
+    "documents": "coalesce(title, '') || ' ' || coalesce(content, '')",
+    "document_chunks": "content"
+}
+
+def migrate_search_vector():
+    """search_vector kolonlarını ve GIN index'lerini ekle (yoksa)"""
+    db = SessionLocal()
+    try:
+        for table, source in SEARCH_VECTOR_SOURCES.items():
+            result = db.execute(text("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = :table AND column_name = 'search_vector';
+            """), {"table": table})
+
+            if result.fetchone() is None:
+                # Tablo yeniden yazılır (büyük tablolarda biraz sürebilir)
+                db.execute(text(f"""
+                    ALTER TABLE {table}
+                    ADD COLUMN search_vector tsvector
+                    GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', {source})) STORED;
+                """))
+                db.commit()
+                logger.info(f"{table}.search_vector kolonu eklendi.")
+
+            db.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS ix_{table}_search_vector
+                ON {table} USING gin (search_vector);
+            """))
+            db.commit()
+
+        logger.info("Migration tamamlandı! (search_vector)")
+
+    except Exception as e:
+        logger.error(f"Migration hatası: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_search_vector()
@@ -0,0 +1,28 @@
+"""
+Migration: Quantize edilmiş vektör index'lerini (halfvec / binary) kur
+Yönetilen ANN index'i embedding'in quantize kopyası üzerine (expression index) yeniden
+kurulur; mevcut tüm satırları kapsar (CONCURRENTLY: tablo yazmaya kapanmaz).
+VECTOR_STORAGE_MODE=halfvec|binary ile uygulamayı başlatmadan önce çalıştırılmalı.
+
+Kullanım:
+    python migrate_vector_quantization.py            # settings.VECTOR_STORAGE_MODE
+    python migrate_vector_quantization.py binary     # belirli mod
+"""
+from services.vector_index import ensure_vector_indexes, storage_mode
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+def migrate_vector_quantization(mode: str = None):
+    mode = mode or storage_mode()
+    if mode == "full":
+        logger.info("'full' modu için quantize index gerekmiyor.")
+        return
+
+    result = ensure_vector_indexes(mode)
+    logger.info(f"Migration tamamlandı! ({mode} index'leri: {result})")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_vector_quantization(sys.argv[1] if len(sys.argv) > 1 else None)
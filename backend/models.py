@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Integer, DateTime, Enum as SQLEnum, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, DateTime, Enum as SQLEnum, ForeignKey, Text, Computed, Index, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY, JSONB
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from database import Base
 import enum
@@ -14,6 +15,9 @@ except ImportError:
     VECTOR_AVAILABLE = False
     Vector = None
 
+# Full-text arama konfigürasyonu (generated tsvector kolonları ve sorgular aynı config'i kullanmalı)
+TEXT_SEARCH_CONFIG = "turkish"
+
 # Enum'lar
 class DocumentStatus(str, enum.Enum):
     indexed = "indexed"
@@ -49,28 +53,110 @@ class Document(Base):
     id = Column(String, primary_key=True, index=True)
     title = Column(String, nullable=False, index=True)
     type = Column(String, nullable=False)  # PDF, Markdown, DOCX, SQL, etc.
-    source_id = Column(String, ForeignKey("sources.id"), nullable=False)
+    source_id = Column(String, ForeignKey("sources.id"), nullable=False, index=True)
     size = Column(String, nullable=False)  # "2.4 MB", "156 KB", etc.
     size_bytes = Column(Integer, nullable=True)  # Gerçek byte değeri
     content = Column(Text, nullable=True)  # RAG için içerik (yeni eklendi)
     embeddings_count = Column(Integer, default=0)
     status = Column(SQLEnum(DocumentStatus), default=DocumentStatus.processing)
+    index_attempts = Column(Integer, default=0, server_default="0", nullable=False)  # Geçici hatayla biten indeksleme denemeleri
+    next_index_at = Column(DateTime(timezone=True), nullable=True)  # Geçici hatadan sonra indeksleyicinin tekrar deneyeceği zaman
     file_path = Column(String, nullable=True)  # Dosyanın fiziksel yolu
     content_hash = Column(String, nullable=True)  # Dosya hash'i (duplicate kontrolü için)
-    doc_metadata = Column(Text, nullable=True)  # JSON metadata (metadata reserved olduğu için doc_metadata)
+    doc_metadata = Column(JSONB, nullable=True)  # url, category, all_tags, ai_summary... (metadata reserved olduğu için doc_metadata)
     
     # Vector embedding (384 boyutlu - all-MiniLM-L6-v2 için)
     embedding = Column(Vector(384), nullable=True) if VECTOR_AVAILABLE else Column(Text, nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Full-text arama (Türkçe stemming, GIN index) - sadece sorguda kullanılır, yüklenmez
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(title, '') || ' ' || coalesce(content, ''))",
+        persisted=True
+    )))
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_documents_search_vector", "search_vector", postgresql_using="gin"),
+        # Metadata filtreleri: etiket (@> containment) ve kategori (->> eşitlik)
+        Index("ix_documents_doc_metadata", "doc_metadata", postgresql_using="gin", postgresql_ops={"doc_metadata": "jsonb_path_ops"}),
+        Index("ix_documents_metadata_category", text("(doc_metadata ->> 'category')")),
+    )
+    
     # Relationship
     source = relationship("Source", back_populates="documents")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Document(id={self.id}, title={self.title}, status={self.status})>"
 
+# Document Chunk Model (Uzun dokümanlar örtüşen parçalar halinde indekslenir)
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    
+    id = Column(String, primary_key=True, index=True)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)  # Doküman içindeki sıra
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, default=0)
+    
+    # Vector embedding (384 boyutlu - all-MiniLM-L6-v2 için)
+    embedding = Column(Vector(384), nullable=True) if VECTOR_AVAILABLE else Column(Text, nullable=True)
+    
+    # Full-text arama (Türkçe stemming, GIN index) - hibrit aramanın lexical tarafı
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"to_tsvector('{TEXT_SEARCH_CONFIG}', content)",
+        persisted=True
+    )))
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_document_chunks_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    
+    # Relationship
+    document = relationship("Document", back_populates="chunks")
+    
+    def __repr__(self):
+        return f"<DocumentChunk(document_id={self.document_id}, chunk_index={self.chunk_index})>"
+
+# Embedding Cache Model (Normalize edilmiş metin hash'i + model adı -> vektör)
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    
+    content_hash = Column(String, primary_key=True)  # sha256(normalize(metin))
+    model_name = Column(String, primary_key=True)  # Farklı modellerin vektörleri karışmasın
+    embedding = Column(Vector(384), nullable=False) if VECTOR_AVAILABLE else Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # LRU eviction için
+    
+    def __repr__(self):
+        return f"<EmbeddingCache(content_hash={self.content_hash}, model_name={self.model_name})>"
+
+# Answer Cache Model (Semantik cevap cache'i: benzer soru + aynı kaynak dokümanlar -> aynı cevap)
+class AnswerCache(Base):
+    __tablename__ = "answer_cache"
+    
+    id = Column(String, primary_key=True)
+    question = Column(Text, nullable=False)
+    question_embedding = Column(Vector(384), nullable=False) if VECTOR_AVAILABLE else Column(Text, nullable=False)
+    documents_fingerprint = Column(String, nullable=False, index=True)  # Kaynak dokümanlar + sürümleri + LLM modeli
+    document_ids = Column(ARRAY(String), nullable=False)  # Doküman değişince ilgili kayıtlar silinir
+    answer = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # LRU eviction için
+    
+    __table_args__ = (
+        Index("ix_answer_cache_document_ids", "document_ids", postgresql_using="gin"),
+    )
+    
+    def __repr__(self):
+        return f"<AnswerCache(id={self.id}, question={self.question[:30]})>"
+
 # Source Model
 class Source(Base):
     __tablename__ = "sources"
@@ -131,7 +217,18 @@ class RSSFeed(Base):
     category = Column(String, nullable=True)  # Teknoloji, İş, Bilim, etc. (backward compatibility)
     category_id = Column(String, ForeignKey("categories.id"), nullable=True)  # Yeni kategori referansı
     is_active = Column(String, default="true")  # Boolean yerine string (SQLite uyumluluğu için)
-    last_fetched_at = Column(DateTime(timezone=True), nullable=True)
+    last_fetched_at = Column(DateTime(timezone=True), nullable=True)  # Son başarılı çekme
+    # Çekme istatistikleri (arka plan zamanlayıcısı ve fetch endpoint'i günceller)
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)  # Son deneme (başarılı/başarısız)
+    last_fetch_duration_ms = Column(Integer, nullable=True)
+    fetch_count = Column(Integer, default=0, server_default="0", nullable=False)
+    error_count = Column(Integer, default=0, server_default="0", nullable=False)
+    consecutive_errors = Column(Integer, default=0, server_default="0", nullable=False)  # Hatalı feed'ler daha seyrek denenir
+    last_error = Column(Text, nullable=True)
+    # Conditional GET: son işlenen içeriğin doğrulayıcıları (değişmeyen feed parse edilmez)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String(64), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
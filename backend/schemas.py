@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional, Literal
+from datetime import datetime
 
 # Dashboard'daki 'Stats' kartları için
 class StatItem(BaseModel):
@@ -43,6 +44,13 @@ class RSSFeedSchema(BaseModel):
     category: Optional[str] = None
     is_active: bool = True
     last_fetched_at: Optional[str] = None
+    # Çekme istatistikleri (arka plan zamanlayıcısı)
+    last_checked_at: Optional[str] = None
+    last_fetch_duration_ms: Optional[int] = None
+    fetch_count: int = 0
+    error_count: int = 0
+    consecutive_errors: int = 0
+    last_error: Optional[str] = None
 
 # Article Schema (Radar listesi için)
 class ArticlePreviewSchema(BaseModel):
@@ -94,9 +102,43 @@ class AddCategoryRequest(BaseModel):
     name: str
 
 # RAG Chat Modelleri
+class ConversationState(BaseModel):
+    """Sohbet durumu: sunucu saklamaz, istemci her cevapta alıp bir sonraki istekte geri gönderir"""
+    model: Optional[str] = None  # context token'larını üreten LLM modeli
+    context: Optional[List[int]] = None  # Ollama'nın döndürdüğü context (önceki turlar tekrar işlenmez)
+    summary: Optional[str] = None  # Eski turların özeti
+    summarized_turns: int = 0  # history'nin baştan kaç mesajı özete girdi
+
+class SearchFilters(BaseModel):
+    """Aramayı kısıtlayan doküman filtreleri (verilenlerin hepsi birlikte uygulanır)"""
+    categories: Optional[List[str]] = None  # doc_metadata.category bunlardan biri
+    tags: Optional[List[str]] = None  # doc_metadata.all_tags bunlardan birini içerir
+    source_ids: Optional[List[str]] = None
+    date_from: Optional[datetime] = None  # Document.created_at >=
+    date_to: Optional[datetime] = None  # Document.created_at <
+
 class ChatRequest(BaseModel):
     message: str
-    history: List[dict] = []  # Önceki konuşmalar (Opsiyonel, Context için)
+    history: List[dict] = []  # Önceki mesajlar: [{"role": "user" | "assistant", "content": "..."}]
+    conversation: Optional[ConversationState] = None  # Önceki cevaptaki conversation
+    filters: Optional[SearchFilters] = None  # Sadece bu dokümanlarda ara (örn. tek kategori)
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = 5  # Sorgu başına sonuç
+    filters: Optional[SearchFilters] = None
+
+class SearchHit(BaseModel):
+    id: str
+    title: str
+    similarity: float
+
+class BatchSearchResult(BaseModel):
+    query: str
+    hits: List[SearchHit]  # En yakından başlayarak
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchResult]  # İstekteki sorgu sırasıyla
 
 class SourceDoc(BaseModel):
     title: str
@@ -106,6 +148,8 @@ class SourceDoc(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceDoc]  # Cevabın dayandığı kaynaklar
+    cached: bool = False  # Cevap semantik cache'ten geldi
+    conversation: Optional[ConversationState] = None  # Sonraki istekte geri gönderilecek sohbet durumu
 
 
 
@@ -0,0 +1,180 @@
+"""
+Answer Cache - Semantik cevap cache'i
+
+Aynı şey farklı şekillerde sorulabilir. Soru vektörü önceki bir soruya yeterince yakınsa
+(ANSWER_CACHE_MIN_SIMILARITY) ve retrieval aynı doküman kümesini getirdiyse LLM çağrılmadan
+önceki cevap döner. Anahtar: retrieval'ın getirdiği dokümanlar + sürümleri (updated_at) + LLM
+modelinden üretilen parmak izi. Doküman değişirse parmak izi tutmaz; ayrıca yeniden indekslenen
+dokümanların kayıtları silinir. Kayıtlar Postgres'te tutulur, tüm worker'lar paylaşır.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import update, delete, select, func
+from database import SessionLocal
+from models import AnswerCache, Document, VECTOR_AVAILABLE
+from config import settings
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import threading
+import hashlib
+import logging
+import json
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Aynı parmak izine sahip en fazla bu kadar kayıt karşılaştırılır (en son kullanılanlar)
+MAX_CANDIDATES = 50
+
+# Her N yeni kayıtta bir boyut kontrolü yap (her insert'te COUNT maliyetli)
+EVICTION_CHECK_INTERVAL = 50
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "evictions": 0, "errors": 0}
+_inserts_since_eviction = 0
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+def _to_db(vector: list):
+    return vector if VECTOR_AVAILABLE else json.dumps(vector)
+
+def _from_db(value) -> np.ndarray:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def _documents_fingerprint(db: Session, document_ids: list[str]) -> str:
+    """Doküman kümesi + her dokümanın son güncellenme zamanı + LLM modeli"""
+    versions = dict(db.query(Document.id, Document.updated_at).filter(Document.id.in_(document_ids)).all())
+    parts = [settings.OLLAMA_MODEL] + [
+        f"{document_id}:{versions[document_id].isoformat() if versions.get(document_id) else ''}"
+        for document_id in sorted(set(document_ids))
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+def _cosine(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1.0)
+    return (matrix @ vector) / np.where(norms > 0, norms, 1.0)
+
+def get_cached_answer(query_vector: list, document_ids: list[str]):
+    """
+    Benzer bir soru aynı dokümanlarla daha önce cevaplandıysa cevabı döner, yoksa None.
+    Bulunan kaydın hit_count/last_used_at değerleri güncellenir (LRU).
+    """
+    if not settings.ANSWER_CACHE_ENABLED or not query_vector or not document_ids:
+        return None
+
+    db = SessionLocal()
+    try:
+        fingerprint = _documents_fingerprint(db, document_ids)
+        min_created_at = datetime.now(timezone.utc) - timedelta(seconds=settings.ANSWER_CACHE_TTL_SECONDS)
+        rows = db.query(
+            AnswerCache.id, AnswerCache.question_embedding, AnswerCache.answer
+        ).filter(
+            AnswerCache.documents_fingerprint == fingerprint,
+            AnswerCache.created_at >= min_created_at
+        ).order_by(AnswerCache.last_used_at.desc()).limit(MAX_CANDIDATES).all()
+
+        if not rows:
+            _count("misses")
+            return None
+
+        similarities = _cosine(
+            np.stack([_from_db(row.question_embedding) for row in rows]),
+            np.asarray(query_vector, dtype=np.float32)
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < settings.ANSWER_CACHE_MIN_SIMILARITY:
+            _count("misses")
+            return None
+
+        db.execute(
+            update(AnswerCache)
+            .where(AnswerCache.id == rows[best].id)
+            .values(hit_count=AnswerCache.hit_count + 1, last_used_at=func.now())
+        )
+        db.commit()
+        _count("hits")
+        return {"answer": rows[best].answer, "similarity": float(similarities[best])}
+    except Exception as e:
+        db.rollback()
+        _count("errors")
+        logger.warning(f"Cevap cache'i okunamadı (devam ediliyor): {e}")
+        return None
+    finally:
+        db.close()
+
+def store_answer(question: str, query_vector: list, document_ids: list[str], answer: str):
+    """LLM'in ürettiği cevabı cache'e yazar"""
+    global _inserts_since_eviction
+    if not settings.ANSWER_CACHE_ENABLED or not query_vector or not document_ids or not answer:
+        return
+
+    db = SessionLocal()
+    try:
+        db.add(AnswerCache(
+            id=str(uuid.uuid4()),
+            question=question,
+            question_embedding=_to_db(list(query_vector)),
+            documents_fingerprint=_documents_fingerprint(db, document_ids),
+            document_ids=sorted(set(document_ids)),
+            answer=answer
+        ))
+        db.commit()
+        _count("stores")
+
+        with _stats_lock:
+            _inserts_since_eviction += 1
+            should_evict = _inserts_since_eviction >= EVICTION_CHECK_INTERVAL
+            if should_evict:
+                _inserts_since_eviction = 0
+        if should_evict:
+            _evict_if_needed(db)
+    except Exception as e:
+        db.rollback()
+        _count("errors")
+        logger.warning(f"Cevap cache'i yazılamadı (devam ediliyor): {e}")
+    finally:
+        db.close()
+
+def invalidate_documents(db: Session, document_ids: list[str]):
+    """
+    Bu dokümanlardan herhangi birine dayanan cevapları siler (document_ids GIN index'i).
+    Çağıran tarafın transaction'ında çalışır; commit çağırana bırakılır.
+    """
+    if not document_ids:
+        return
+    result = db.execute(
+        delete(AnswerCache).where(AnswerCache.document_ids.overlap(list(document_ids)))
+    )
+    if result.rowcount:
+        _count("invalidations", result.rowcount)
+
+def _evict_if_needed(db: Session):
+    """Süresi dolan kayıtları ve ANSWER_CACHE_MAX_ENTRIES'i aşan en az kullanılan kayıtları siler"""
+    min_created_at = datetime.now(timezone.utc) - timedelta(seconds=settings.ANSWER_CACHE_TTL_SECONDS)
+    evicted = db.execute(delete(AnswerCache).where(AnswerCache.created_at < min_created_at)).rowcount or 0
+
+    max_entries = settings.ANSWER_CACHE_MAX_ENTRIES
+    total = db.query(func.count()).select_from(AnswerCache).scalar() or 0
+    if total > max_entries:
+        cutoff = select(AnswerCache.last_used_at).order_by(
+            AnswerCache.last_used_at.desc()
+        ).offset(max_entries).limit(1).scalar_subquery()
+        evicted += db.execute(delete(AnswerCache).where(AnswerCache.last_used_at <= cutoff)).rowcount or 0
+
+    db.commit()
+    if evicted:
+        _count("evictions", evicted)
+        logger.info(f"Cevap cache'i temizlendi: {evicted} kayıt silindi")
+
+def get_answer_cache_stats() -> dict:
+    """Hit/miss sayaçları (bu process için)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["max_entries"] = settings.ANSWER_CACHE_MAX_ENTRIES
+    stats["enabled"] = settings.ANSWER_CACHE_ENABLED
+    return stats
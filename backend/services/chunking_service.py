@@ -0,0 +1,84 @@
+"""
+Chunking Service - Uzun metinleri token bazlı, örtüşen parçalara böler
+"""
+from services.embedding_service import get_model
+from services.embedding_cache import normalize_text
+from config import settings
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Parça sonu mümkünse cümle sonuna hizalanır
+SENTENCE_END_TOKENS = {".", "!", "?", "…"}
+
+_word_re = re.compile(r"\w+|[^\w\s]")
+
+def _token_offsets(text: str) -> list[tuple[int, int]]:
+    """
+    Metindeki her token'ın (başlangıç, bitiş) karakter konumlarını döner.
+    Embedding modelinin tokenizer'ı kullanılır; offset desteklemiyorsa
+    kelime/noktalama bazlı yaklaşık bölmeye düşülür.
+    """
+    try:
+        tokenizer = get_model().tokenizer
+        encoded = tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )
+        return [tuple(offset) for offset in encoded["offset_mapping"]]
+    except Exception as e:
+        logger.debug(f"Tokenizer offset'leri alınamadı, kelime bazlı bölünüyor: {e}")
+        return [match.span() for match in _word_re.finditer(text)]
+
+def count_tokens(text: str) -> int:
+    """Metnin embedding tokenizer'ına göre token sayısı"""
+    if not text:
+        return 0
+    return len(_token_offsets(text))
+
+def split_into_chunks(text: str, chunk_tokens: int = None, overlap_tokens: int = None) -> list[dict]:
+    """
+    Metni en fazla chunk_tokens uzunluğunda, overlap_tokens kadar örtüşen parçalara böler.
+
+    Returns:
+        [{"content": str, "token_count": int}, ...] (metin sırasıyla)
+    """
+    chunk_tokens = chunk_tokens or settings.CHUNK_SIZE_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+
+    text = normalize_text(text)
+    if not text:
+        return []
+
+    offsets = _token_offsets(text)
+    if len(offsets) <= chunk_tokens:
+        return [{"content": text, "token_count": len(offsets)}]
+
+    chunks = []
+    start = 0
+    total = len(offsets)
+    while start < total:
+        end = min(start + chunk_tokens, total)
+
+        # Parçayı pencerenin ikinci yarısındaki son cümle sonuna hizala
+        if end < total:
+            for i in range(end - 1, start + chunk_tokens // 2, -1):
+                token_start, token_end = offsets[i]
+                if text[token_start:token_end] in SENTENCE_END_TOKENS:
+                    end = i + 1
+                    break
+
+        chunks.append({
+            "content": text[offsets[start][0]:offsets[end - 1][1]],
+            "token_count": end - start
+        })
+
+        if end >= total:
+            break
+        start = max(end - overlap_tokens, start + 1)
+
+    return chunks
@@ -0,0 +1,92 @@
+"""
+Context Builder - LLM'e gidecek parçaları token bütçesi içinde seçer
+Maximal Marginal Relevance (MMR): her adımda soruyla alakası yüksek, seçilmiş parçalara
+benzerliği düşük parça seçilir. Aynı haberin farklı kaynaklardaki kopyaları gibi
+neredeyse aynı parçalar bütçeyi harcamaz. Benzerlikler tek matris çarpımıyla hesaplanır.
+"""
+from services.chunking_service import count_tokens
+from config import settings
+import numpy as np
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+def _scale(scores: np.ndarray) -> np.ndarray:
+    """Rerank skorlarını (logit) cosine benzerliğiyle karşılaştırılabilir olsun diye [0, 1]'e çeker"""
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+def passage_tokens(passage: dict) -> int:
+    """Parçanın token sayısı (indekslemede hesaplanmadıysa embedding tokenizer'ı ile sayılır)"""
+    return passage.get("token_count") or count_tokens(passage["content"])
+
+def select_passages(
+    query_vector: list,
+    passages: list[dict],
+    embeddings,
+    max_tokens: int = None,
+    max_documents: int = None,
+    relevance: list[float] = None,
+    mmr_lambda: float = None
+) -> list[dict]:
+    """
+    Bütçe dolana kadar MMR ile parça seçer.
+
+    Args:
+        passages: Aday parçalar ({"document_id", "content", "token_count", ...})
+        embeddings: Adayların vektörleri (satır sırası passages ile aynı)
+        relevance: Verilirse (örn. cross-encoder skorları) soruya alaka olarak bu kullanılır,
+            yoksa soru vektörüyle cosine benzerliği. Soru vektörü de yoksa (embedding
+            başarısız, full-text fallback) adayların sırası alaka sayılır.
+        mmr_lambda: 1 = sadece alaka, 0 = sadece çeşitlilik
+
+    Returns:
+        Seçilen parçalar seçim sırasıyla (en alakalıdan başlayarak), "token_count" dolu
+    """
+    if not passages:
+        return []
+
+    max_tokens = max_tokens or settings.CONTEXT_MAX_TOKENS
+    max_documents = max_documents or settings.CONTEXT_MAX_DOCUMENTS
+    mmr_lambda = settings.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+    if relevance is not None:
+        relevance = _scale(np.asarray(relevance, dtype=np.float32))
+    elif query_vector is None or len(query_vector) == 0:
+        # Aday sırası (örn. full-text sıralaması) korunur: ilk aday 1, sonuncusu 1/n
+        relevance = 1.0 - np.arange(len(passages), dtype=np.float32) / len(passages)
+    else:
+        relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+
+    pairwise = vectors @ vectors.T
+    tokens = np.array([passage_tokens(passage) for passage in passages])
+    _, documents = np.unique([passage["document_id"] for passage in passages], return_inverse=True)
+
+    redundancy = np.zeros(len(passages), dtype=np.float32)  # Seçilmiş parçalara en yüksek benzerlik
+    available = np.ones(len(passages), dtype=bool)
+    selected_documents = np.zeros(documents.max() + 1, dtype=bool)
+    budget = max_tokens
+    selected = []
+
+    while True:
+        # En iyi parça bütçeyi tek başına aşsa da gönderilir (hiç kaynak kalmasın diye)
+        candidates = available & ((tokens <= budget) | (not selected))
+        if selected_documents.sum() >= max_documents:
+            candidates &= selected_documents[documents]
+        if not candidates.any():
+            break
+
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        best = int(np.argmax(np.where(candidates, scores, -np.inf)))
+
+        selected.append(best)
+        available[best] = False
+        selected_documents[documents[best]] = True
+        budget -= tokens[best]
+        redundancy = np.maximum(redundancy, pairwise[best])
+        # Seçilmiş bir parçanın neredeyse aynısı olan adaylar hiç alınmaz
+        available &= redundancy < settings.CONTEXT_DUPLICATE_SIMILARITY
+
+    return [{**passages[i], "token_count": int(tokens[i])} for i in selected]
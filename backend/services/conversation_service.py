@@ -0,0 +1,130 @@
+"""
+Conversation Service - Çok turlu sohbet (ChatRequest.history)
+
+Sunucu sohbet saklamaz; istemci her cevapta dönen "conversation" durumunu bir sonraki
+istekte geri gönderir:
+- context: Ollama'nın döndürdüğü context token'ları. Gönderilirse önceki turlar prompt'a
+  tekrar yazılmaz (Ollama tekrar işlemez), prompt sadece yeni turu içerir.
+- summary / summarized_turns: Eski mesajların özeti ve history'nin kaçıncı mesajına kadar
+  özetlendiği. Context settings.chat_context_limit'i geçince (ya da hiç yoksa) özet + son
+  mesajlarla (CHAT_HISTORY_TOKENS) yeniden başlanır; böylece prompt her turda büyümez.
+"""
+from services import llm_client
+from services.chunking_service import count_tokens
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLE_LABELS = {"user": "KULLANICI", "assistant": "TUYGUN"}
+
+# Takip sorusunu yeniden yazarken bakılacak son mesaj sayısı
+REWRITE_MESSAGES = 4
+
+def normalize_history(history: list) -> list[dict]:
+    """Geçerli mesajlar: [{"role": "user" | "assistant", "content": str}, ...]"""
+    messages = []
+    for message in history or []:
+        if not isinstance(message, dict):
+            continue
+        role = message.get("role")
+        content = (message.get("content") or "").strip()
+        if role in ROLE_LABELS and content:
+            messages.append({"role": role, "content": content})
+    return messages
+
+def format_messages(messages: list[dict]) -> str:
+    return "\n".join(f"{ROLE_LABELS[message['role']]}: {message['content']}" for message in messages)
+
+def _split_recent(messages: list[dict]) -> tuple[list, list]:
+    """(eski, son) mesajlar: sondan geriye CHAT_HISTORY_TOKENS dolana kadar olanlar 'son' sayılır"""
+    budget = settings.CHAT_HISTORY_TOKENS
+    start = len(messages)
+    while start > 0:
+        tokens = count_tokens(messages[start - 1]["content"])
+        if tokens > budget:
+            break
+        budget -= tokens
+        start -= 1
+    return messages[:start], messages[start:]
+
+async def _summarize(summary: str, messages: list[dict]) -> str:
+    """Önceki özeti ve yeni eski mesajları tek bir kısa özette birleştirir"""
+    previous = f"ÖNCEKİ ÖZET:\n{summary}\n\n" if summary else ""
+    prompt = f"""Aşağıdaki sohbeti, devamında gerekecek bilgileri (konular, isimler, sorular, cevaplardaki önemli noktalar) koruyarak Türkçe ve kısa bir paragrafta özetle. Sadece özeti yaz.
+
+{previous}MESAJLAR:
+{format_messages(messages)}
+
+ÖZET:"""
+    try:
+        response = await llm_client.generate(
+            prompt, options={"temperature": 0, "num_predict": settings.CHAT_SUMMARY_MAX_TOKENS}
+        )
+        return response.get("response", "").strip() or summary
+    except llm_client.LLMError as e:
+        # Özet üretilemezse eski mesajlar düşer; sohbet yine de devam eder
+        logger.warning(f"Sohbet özeti oluşturulamadı: {e}")
+        return summary
+
+async def prepare_conversation(history: list, state: dict = None) -> dict:
+    """
+    Bu turda LLM'e gidecek sohbet geçmişini belirler.
+
+    Returns:
+        {"messages", "summary", "summarized_turns", "context"}: context doluysa messages
+        boştur (önceki turlar context'te); değilse prompt'a summary + messages yazılır
+    """
+    state = state or {}
+    messages = normalize_history(history)
+    summarized_turns = min(state.get("summarized_turns") or 0, len(messages))
+    summary = state.get("summary") or ""
+    pending = messages[summarized_turns:]
+
+    context = state.get("context")
+    if context and state.get("model") == settings.OLLAMA_MODEL and len(context) <= settings.chat_context_limit:
+        return {"messages": [], "summary": summary, "summarized_turns": summarized_turns, "context": context}
+
+    older, recent = _split_recent(pending)
+    if older:
+        summary = await _summarize(summary, older)
+        summarized_turns += len(older)
+
+    return {"messages": recent, "summary": summary, "summarized_turns": summarized_turns, "context": None}
+
+async def rewrite_question(question: str, history: list, summary: str = "") -> str:
+    """
+    Takip sorusunu ("peki ya fiyatı?") önceki mesajlara bakarak tek başına anlaşılır
+    bir soruya çevirir; retrieval bu soruyla yapılır. Geçmiş yoksa soru aynen döner.
+    """
+    messages = normalize_history(history)[-REWRITE_MESSAGES:]
+    if not messages or not settings.CHAT_REWRITE_FOLLOWUPS:
+        return question
+
+    summary_line = f"SOHBET ÖZETİ: {summary}\n" if summary else ""
+    prompt = f"""Sohbetin devamındaki son soruyu, önceki mesajları bilmeyen biri de anlayacak şekilde tek başına anlaşılır bir soru olarak yeniden yaz. Zamirleri ve eksik kısımları açıkça yaz. Sadece soruyu yaz.
+
+{summary_line}{format_messages(messages)}
+
+SON SORU: {question}
+
+YENİDEN YAZILMIŞ SORU:"""
+    try:
+        response = await llm_client.generate(prompt, options={"temperature": 0, "num_predict": 64})
+        rewritten = response.get("response", "").strip().splitlines()
+        rewritten = rewritten[0].strip(' "\'') if rewritten else ""
+        return rewritten or question
+    except llm_client.LLMError as e:
+        # LLM yoksa son kullanıcı mesajıyla birlikte aranır
+        logger.warning(f"Takip sorusu yeniden yazılamadı: {e}")
+        previous = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        return f"{previous} {question}".strip()
+
+def next_state(conversation: dict, context: list = None) -> dict:
+    """Cevapla birlikte istemciye dönen sohbet durumu"""
+    return {
+        "model": settings.OLLAMA_MODEL,
+        "context": context,
+        "summary": conversation["summary"] or None,
+        "summarized_turns": conversation["summarized_turns"]
+    }
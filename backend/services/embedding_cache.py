@@ -0,0 +1,163 @@
+"""
+Embedding Cache - Aynı metnin tekrar vektörleştirilmesini engeller
+
+Anahtar: normalize edilmiş metnin sha256 hash'i + model adı.
+Vektörler Postgres'te (embedding_cache tablosu) tutulur, böylece tüm
+gunicorn worker'ları ve yeniden başlatmalar aynı cache'i paylaşır.
+"""
+from sqlalchemy import update, delete, select, func
+from sqlalchemy.dialects.postgresql import insert
+from database import SessionLocal
+from models import EmbeddingCache, VECTOR_AVAILABLE
+from config import settings
+import threading
+import hashlib
+import logging
+import json
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Her N yeni kayıtta bir boyut kontrolü yap (her insert'te COUNT maliyetli)
+EVICTION_CHECK_INTERVAL = 100
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+_inserts_since_eviction = 0
+
+_whitespace_re = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Metni cache anahtarı ve model girdisi için normalize eder.
+    Unicode NFC + tüm boşluk karakterlerini tek boşluğa indirger.
+    (Tokenizer zaten boşluklardan böldüğü için vektör değişmez.)
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFC", text)
+    return _whitespace_re.sub(" ", text).strip()
+
+def compute_content_hash(text: str) -> str:
+    """Normalize edilmiş metnin sha256 hash'i (Document.content_hash için de kullanılır)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def _to_db(vector: list):
+    return vector if VECTOR_AVAILABLE else json.dumps(vector)
+
+def _from_db(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return [float(x) for x in value]
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+def get_cached_embeddings(content_hashes: list[str], model_name: str) -> dict:
+    """
+    Cache'teki vektörleri döner: {content_hash: embedding}
+    Bulunan kayıtların hit_count/last_used_at değerleri aynı sorguda güncellenir (LRU).
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED or not content_hashes:
+        return {}
+
+    unique_hashes = list(dict.fromkeys(content_hashes))
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            update(EmbeddingCache)
+            .where(
+                EmbeddingCache.model_name == model_name,
+                EmbeddingCache.content_hash.in_(unique_hashes)
+            )
+            .values(
+                hit_count=EmbeddingCache.hit_count + 1,
+                last_used_at=func.now()
+            )
+            .returning(EmbeddingCache.content_hash, EmbeddingCache.embedding)
+        ).all()
+        db.commit()
+
+        found = {row.content_hash: _from_db(row.embedding) for row in rows}
+        _count("hits", len(found))
+        _count("misses", len(unique_hashes) - len(found))
+        return found
+    except Exception as e:
+        db.rollback()
+        _count("errors")
+        logger.warning(f"Embedding cache okunamadı (devam ediliyor): {e}")
+        return {}
+    finally:
+        db.close()
+
+def store_embeddings(items: dict, model_name: str):
+    """
+    Yeni vektörleri cache'e yazar: {content_hash: embedding}
+    Aynı anahtar başka bir worker tarafından yazıldıysa sessizce geçilir.
+    """
+    global _inserts_since_eviction
+    if not settings.EMBEDDING_CACHE_ENABLED or not items:
+        return
+
+    values = [
+        {"content_hash": content_hash, "model_name": model_name, "embedding": _to_db(vector)}
+        for content_hash, vector in items.items()
+        if vector
+    ]
+    if not values:
+        return
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(EmbeddingCache)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["content_hash", "model_name"])
+        )
+        db.commit()
+        _count("stores", len(values))
+
+        with _stats_lock:
+            _inserts_since_eviction += len(values)
+            should_evict = _inserts_since_eviction >= EVICTION_CHECK_INTERVAL
+            if should_evict:
+                _inserts_since_eviction = 0
+        if should_evict:
+            _evict_if_needed(db)
+    except Exception as e:
+        db.rollback()
+        _count("errors")
+        logger.warning(f"Embedding cache yazılamadı (devam ediliyor): {e}")
+    finally:
+        db.close()
+
+def _evict_if_needed(db):
+    """Cache EMBEDDING_CACHE_MAX_ENTRIES'i aşarsa en az kullanılan kayıtları siler"""
+    max_entries = settings.EMBEDDING_CACHE_MAX_ENTRIES
+    total = db.query(func.count()).select_from(EmbeddingCache).scalar() or 0
+    if total <= max_entries:
+        return
+
+    # max_entries'inci en yeni kaydın zamanından eski olanları sil
+    cutoff = select(EmbeddingCache.last_used_at).order_by(
+        EmbeddingCache.last_used_at.desc()
+    ).offset(max_entries).limit(1).scalar_subquery()
+
+    result = db.execute(delete(EmbeddingCache).where(EmbeddingCache.last_used_at <= cutoff))
+    db.commit()
+    _count("evictions", result.rowcount or 0)
+    logger.info(f"Embedding cache temizlendi: {result.rowcount} kayıt silindi")
+
+def get_cache_stats() -> dict:
+    """Hit/miss sayaçları (bu process için)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["max_entries"] = settings.EMBEDDING_CACHE_MAX_ENTRIES
+    stats["enabled"] = settings.EMBEDDING_CACHE_ENABLED
+    return stats
@@ -2,27 +2,133 @@
 Embedding Service - Metinleri vektörlere çevirir
 """
 from sentence_transformers import SentenceTransformer
+from services.embedding_cache import normalize_text, compute_content_hash, get_cached_embeddings, store_embeddings, get_cache_stats
+from services.lru_cache import LRUCache
+from concurrent.futures import Future
+from typing import Iterable, Iterator
+from config import settings
+import threading
+import asyncio
 import logging
+import platform
+import queue
+import time
+import os
 
 logger = logging.getLogger(__name__)
 
 # Model: all-MiniLM-L6-v2 (Hızlı, Hafif, CPU dostu, Türkçe performansı makul)
 MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384
 _model = None
+_model_lock = threading.Lock()
+_active_backend = None  # Yüklenen modelin gerçek backend'i (onnx yüklenemezse torch'a düşülür)
+
+_ready = False  # Model yüklendi mi (readiness endpoint'i için; warm-up ya da ilk istekte)
+
+# Warm-up için farklı uzunluklarda örnek metinler (ilk forward pass'teki tahsisleri önceden yapar)
+WARMUP_TEXTS = [
+    "TUYGUN",
+    "Yapay zeka ile bilgi yönetimi nasıl yapılır?",
+    " ".join(["Uzun bir paragraf örneği, modelin en büyük giriş boyutunu da ısıtmak için."] * 20),
+]
+
+# ONNX Runtime parity eşiği: quantize edilmiş model PyTorch çıktısıyla bu kadar uyumlu olmalı
+PARITY_MIN_COSINE = 0.98
+
+def _onnx_file_name() -> str:
+    """
+    Kullanılacak ONNX dosyası. Model reposunda hazır export edilmiş dosyalar var:
+    int8 quantize edilmiş ARM64 (Oracle Ampere) ve AVX2 (x86) versiyonları.
+    """
+    if settings.EMBEDDING_ONNX_FILE:
+        return settings.EMBEDDING_ONNX_FILE
+    if not settings.EMBEDDING_ONNX_QUANTIZED:
+        return "onnx/model.onnx"
+    if platform.machine().lower() in ("aarch64", "arm64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+def _configured_backend() -> str:
+    return (settings.EMBEDDING_BACKEND or "torch").lower()
+
+def _load_model(backend: str):
+    """SentenceTransformer'ı istenen backend ile yükler"""
+    if backend == "onnx":
+        # sentence-transformers>=3.2 + onnxruntime gerekir (pip install "sentence-transformers[onnx]")
+        return SentenceTransformer(
+            MODEL_NAME,
+            backend="onnx",
+            model_kwargs={"file_name": _onnx_file_name()}
+        )
+    return SentenceTransformer(MODEL_NAME)
 
 def get_model():
     """Embedding modelini yükler (lazy loading)"""
-    global _model
+    global _model, _active_backend, _ready
     if _model is None:
-        logger.info(f"Embedding modeli yükleniyor: {MODEL_NAME}...")
-        try:
-            _model = SentenceTransformer(MODEL_NAME)
-            logger.info("Model başarıyla yüklendi.")
-        except Exception as e:
-            logger.error(f"Model yüklenirken hata: {e}")
-            raise
+        # Dispatcher thread'i ve request thread'i aynı anda yüklemeye çalışmasın
+        with _model_lock:
+            if _model is None:
+                backend = _configured_backend()
+                logger.info(f"Embedding modeli yükleniyor: {MODEL_NAME} ({backend})...")
+                try:
+                    _model = _load_model(backend)
+                    _active_backend = backend
+                    logger.info("Model başarıyla yüklendi.")
+                except Exception as e:
+                    if backend == "torch":
+                        logger.error(f"Model yüklenirken hata: {e}")
+                        raise
+                    logger.warning(f"{backend} backend yüklenemedi, torch'a geçiliyor: {e}")
+                    _model = _load_model("torch")
+                    _active_backend = "torch"
+                    logger.info("Model başarıyla yüklendi (torch).")
+                _ready = True
     return _model
 
+def unload_model():
+    """Yüklü modeli bırakır; bir sonraki get_model() çağrısı güncel ayarlarla yeniden yükler"""
+    global _model, _active_backend, _ready
+    with _model_lock:
+        _model = None
+        _active_backend = None
+        _ready = False
+
+def warmup_model() -> float:
+    """
+    Modeli yükler ve örnek metinlerle ısıtır; böylece ilk gerçek istek
+    model yükleme maliyetini ödemez. Cache atlanır (model gerçekten çalışmalı).
+    
+    Returns:
+        Geçen süre (saniye)
+    """
+    global _ready
+    start = time.perf_counter()
+    model = get_model()
+    model.encode(WARMUP_TEXTS, normalize_embeddings=True)
+    _ready = True
+    elapsed = time.perf_counter() - start
+    logger.info(f"Embedding modeli ısıtıldı ({elapsed:.2f} sn)")
+    return elapsed
+
+def is_model_ready() -> bool:
+    return _ready
+
+def get_active_backend() -> str:
+    """Yüklü modelin gerçek backend'i (onnx yüklenemediyse "torch"); model yüklenmediyse None"""
+    return _active_backend
+
+def get_model_id() -> str:
+    """
+    Cache anahtarında kullanılan model kimliği.
+    Quantize edilmiş ONNX vektörleri PyTorch'tan birebir aynı olmadığı için ayrı tutulur.
+    """
+    backend = _active_backend or _configured_backend()
+    if backend == "onnx":
+        return f"{MODEL_NAME}:{_onnx_file_name()}"
+    return MODEL_NAME
+
 def generate_embedding(text: str) -> list:
     """
     Metni vektöre çevirir (384 boyutlu float listesi)
@@ -36,18 +142,45 @@ def generate_embedding(text: str) -> list:
     if not text or not text.strip():
         return []
     
+    # Eşzamanlı istekler micro-batch olarak tek forward pass'te işlenir
+    if settings.EMBEDDING_DISPATCHER_ENABLED:
+        return _dispatcher.submit(text).result()
+    
+    return _encode_single(text)
+
+async def generate_embedding_async(text: str) -> list:
+    """
+    generate_embedding'in event loop'u bloklamayan versiyonu (async endpoint'ler için)
+    """
+    if not text or not text.strip():
+        return []
+    
+    if settings.EMBEDDING_DISPATCHER_ENABLED:
+        return await asyncio.wrap_future(_dispatcher.submit(text))
+    
+    return await asyncio.get_running_loop().run_in_executor(None, _encode_single, text)
+
+def _encode_single(text: str) -> list:
+    """Tek metni (cache kontrolüyle) doğrudan modelden geçirir"""
     try:
-        model = get_model()
         # Metindeki yeni satırları temizle ve normalize et
-        clean_text = text.replace("\n", " ").replace("\r", " ").strip()
+        # (max_seq_length'i aşan kısmı model keser; uzun dokümanlar chunking_service ile parçalanır)
+        clean_text = normalize_text(text)
         
-        # Çok uzun metinleri parçalara böl (max 512 token)
-        if len(clean_text) > 2000:
-            # İlk 2000 karakteri al (basit yaklaşım)
-            clean_text = clean_text[:2000]
+        # Model cache'ten önce yüklenir: onnx yüklenemeyip torch'a düşülürse cache anahtarı
+        # gerçekten yüklenen backend'in model kimliği olmalı
+        model = get_model()
+        model_id = get_model_id()
         
-        embedding = model.encode(clean_text, normalize_embeddings=True)
-        return embedding.tolist()
+        # Önce cache'e bak (aynı metin daha önce vektörleştirildiyse model çalışmaz)
+        content_hash = compute_content_hash(clean_text)
+        cached = get_cached_embeddings([content_hash], model_id)
+        if content_hash in cached:
+            return cached[content_hash]
+        
+        embedding = model.encode(clean_text, normalize_embeddings=True).tolist()
+        store_embeddings({content_hash: embedding}, model_id)
+        return embedding
     except Exception as e:
         logger.error(f"Embedding oluşturulurken hata: {e}")
         return []
@@ -60,26 +193,283 @@ def generate_embeddings_batch(texts: list[str]) -> list[list[float]]:
         texts: Vektörleştirilecek metin listesi
         
     Returns:
-        Embedding listesi
+        Girdiyle aynı uzunlukta ve aynı sırada embedding listesi
+        (boş metinlerin yerinde boş liste bulunur)
     """
     if not texts:
         return []
     
     try:
-        model = get_model()
-        # Metinleri temizle
-        clean_texts = [
-            text.replace("\n", " ").replace("\r", " ").strip()[:2000]
-            for text in texts
-            if text and text.strip()
-        ]
-        
-        if not clean_texts:
-            return []
-        
-        embeddings = model.encode(clean_texts, normalize_embeddings=True)
-        return embeddings.tolist()
+        results = [[] for _ in texts]
+        for index, embedding in iter_embeddings_batch(texts):
+            results[index] = embedding
+        return results
     except Exception as e:
         logger.error(f"Toplu embedding oluşturulurken hata: {e}")
         return []
 
+def iter_embeddings_batch(texts: Iterable[str], batch_size: int = None) -> Iterator[tuple[int, list]]:
+    """
+    Çok büyük girdiler için akış (generator) halinde vektörleştirme.
+    Girdi EMBEDDING_STREAM_WINDOW'luk pencerelerle okunur, her pencere işlenince
+    sonuçları girdi sırasıyla (index, embedding) olarak üretilir; böylece tüm
+    vektörler aynı anda bellekte tutulmaz. texts bir liste veya iterator olabilir.
+    Hatalar çağırana iletilir.
+    """
+    batch_size = batch_size or settings.EMBEDDING_ENCODE_BATCH_SIZE
+    window_size = max(batch_size, settings.EMBEDDING_STREAM_WINDOW)
+    
+    window = []
+    for index, text in enumerate(texts):
+        window.append((index, normalize_text(text) if text else ""))
+        if len(window) >= window_size:
+            yield from _embed_window(window, batch_size)
+            window = []
+    
+    if window:
+        yield from _embed_window(window, batch_size)
+
+def _embed_window(window: list[tuple[int, str]], batch_size: int) -> Iterator[tuple[int, list]]:
+    """Bir pencereyi cache kontrolüyle vektörleştirir, sonuçları girdi sırasıyla üretir"""
+    # Model önce yüklenir ki cache anahtarı gerçekten yüklenen backend'in kimliği olsun (bkz. _encode_single)
+    get_model()
+    model_id = get_model_id()
+    hashes = {index: compute_content_hash(text) for index, text in window if text}
+    
+    # Cache'te olanları ayır, sadece eksikleri modele gönder
+    embeddings = get_cached_embeddings(list(hashes.values()), model_id)
+    missing = {}
+    for index, text in window:
+        content_hash = hashes.get(index)
+        if content_hash and content_hash not in embeddings and content_hash not in missing:
+            missing[content_hash] = text
+    
+    if missing:
+        embeddings.update(_encode_length_bucketed(missing, batch_size, model_id))
+    
+    for index, _ in window:
+        content_hash = hashes.get(index)
+        yield index, embeddings[content_hash] if content_hash else []
+
+def _encode_length_bucketed(missing: dict, batch_size: int, model_id: str) -> dict:
+    """
+    Metinleri uzunluğa göre sıralayıp batch'lere böler: benzer uzunluktaki metinler
+    aynı forward pass'e düşer, kısa metinler uzunların boyuna padding'lenmez.
+    
+    Args:
+        missing: {content_hash: metin}
+    Returns:
+        {content_hash: embedding}
+    """
+    model = get_model()
+    ordered = sorted(missing.items(), key=lambda item: len(item[1]))
+    
+    new_embeddings = {}
+    for start in range(0, len(ordered), batch_size):
+        bucket = ordered[start:start + batch_size]
+        vectors = model.encode(
+            [text for _, text in bucket],
+            batch_size=batch_size,
+            normalize_embeddings=True
+        ).tolist()
+        new_embeddings.update(zip((content_hash for content_hash, _ in bucket), vectors))
+    
+    store_embeddings(new_embeddings, model_id)
+    return new_embeddings
+
+def _query_cache_key(query: str):
+    # Model uncased olduğu için (tokenizer zaten küçük harfe çevirir) büyük/küçük harf farkı vektörü değiştirmez
+    return (get_model_id(), normalize_text(query).lower())
+
+def generate_query_embedding(query: str) -> list:
+    """
+    Arama sorgusu için vektör. Tekrarlanan (veya sadece boşluk/harf büyüklüğü farklı)
+    sorular process içi LRU/TTL cache'ten döner, model hiç çalışmaz.
+    """
+    if not query or not query.strip():
+        return []
+    
+    key = _query_cache_key(query)
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    embedding = generate_embedding(query)
+    if embedding:
+        _query_cache.set(key, embedding)
+    return embedding
+
+async def generate_query_embedding_async(query: str) -> list:
+    """generate_query_embedding'in event loop'u bloklamayan versiyonu"""
+    if not query or not query.strip():
+        return []
+    
+    key = _query_cache_key(query)
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    embedding = await generate_embedding_async(query)
+    if embedding:
+        _query_cache.set(key, embedding)
+    return embedding
+
+def generate_query_embeddings_batch(queries: list[str]) -> list[list[float]]:
+    """
+    Birden fazla arama sorgusu için vektörler (girdi sırasıyla; boş sorguların yerinde boş liste).
+    Query cache'te olmayanlar tek generate_embeddings_batch çağrısında vektörleştirilir.
+    """
+    results = [[] for _ in queries]
+    missing = {}
+    for index, query in enumerate(queries):
+        if not query or not query.strip():
+            continue
+        cached = _query_cache.get(_query_cache_key(query))
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.setdefault(normalize_text(query), []).append(index)
+    
+    if missing:
+        texts = list(missing)
+        for text, embedding in zip(texts, generate_embeddings_batch(texts)):
+            if not embedding:
+                continue
+            _query_cache.set(_query_cache_key(text), embedding)
+            for index in missing[text]:
+                results[index] = embedding
+    return results
+
+def check_backend_parity(texts: list[str] = None) -> dict:
+    """
+    Yapılandırılmış backend'in (örn. quantize ONNX) PyTorch referansıyla
+    aynı anlamsal çıktıyı verdiğini doğrular (metin başına cosine benzerliği).
+    Vektörler normalize olduğu için cosine = iç çarpım.
+    """
+    import numpy as np
+    
+    texts = texts or [
+        "Yapay zeka modelleri CPU üzerinde nasıl hızlandırılır?",
+        "SAP ABAP fonksiyon modülleri ve BAPI kullanımı",
+        "Qlik Sense script ile artımlı veri yükleme",
+        "PostgreSQL pgvector ile semantik arama",
+        "The quick brown fox jumps over the lazy dog.",
+    ]
+    candidate = get_model()
+    reference = candidate if _active_backend == "torch" else _load_model("torch")
+    
+    candidate_vectors = candidate.encode(texts, normalize_embeddings=True)
+    reference_vectors = reference.encode(texts, normalize_embeddings=True)
+    cosines = np.sum(np.asarray(candidate_vectors) * np.asarray(reference_vectors), axis=1)
+    
+    return {
+        "backend": _active_backend,
+        "model_id": get_model_id(),
+        "dimension": int(np.asarray(candidate_vectors).shape[1]),
+        "min_cosine": round(float(cosines.min()), 6),
+        "mean_cosine": round(float(cosines.mean()), 6),
+        "passed": bool(cosines.min() >= PARITY_MIN_COSINE
+                       and np.asarray(candidate_vectors).shape[1] == EMBEDDING_DIMENSION)
+    }
+
+class EmbeddingDispatcher:
+    """
+    Micro-batching kuyruğu: Eşzamanlı gelen tekil embedding isteklerini
+    en fazla max_wait_ms süre veya max_batch_size adet birikene kadar toplar,
+    generate_embeddings_batch ile tek forward pass'te işler ve her çağıranın
+    Future'ını kendi sonucuyla tamamlar.
+    """
+    
+    def __init__(self, max_batch_size: int, max_wait_ms: int):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats = {"batches": 0, "items": 0, "max_batch": 0}
+    
+    def _ensure_started(self):
+        # Gunicorn fork'undan sonra thread'ler kopyalanmaz; her process kendi worker'ını başlatır
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-dispatcher", daemon=True
+                )
+                self._thread.start()
+    
+    def submit(self, text: str) -> Future:
+        """Metni kuyruğa ekler, sonucu taşıyacak Future'ı döner"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def _collect_batch(self) -> list:
+        """İlk isteği bekler, sonra süre/adet limitine kadar kuyruğu boşaltır"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = generate_embeddings_batch(texts)
+                if len(embeddings) != len(batch):
+                    # generate_embeddings_batch hata durumunda boş liste döner
+                    embeddings = [[] for _ in batch]
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:
+                logger.error(f"Embedding dispatcher hatası: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+    
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["avg_batch"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["queue_size"] = self._queue.qsize()
+        return stats
+
+_dispatcher = EmbeddingDispatcher(
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
+)
+
+def get_dispatcher_stats() -> dict:
+    """Micro-batching istatistikleri (bu process için)"""
+    return _dispatcher.get_stats()
+
+_query_cache = LRUCache(
+    max_size=settings.QUERY_CACHE_MAX_SIZE,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS
+)
+
+def get_embedding_metrics() -> dict:
+    """Embedding katmanının tüm cache ve batching metrikleri (bu process için)"""
+    return {
+        "model_id": get_model_id(),
+        "model_ready": _ready,
+        "query_cache": _query_cache.stats(),
+        "embedding_cache": get_cache_stats(),
+        "dispatcher": get_dispatcher_stats()
+    }
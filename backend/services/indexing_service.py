@@ -0,0 +1,259 @@
+"""
+Indexing Service - Dokümanları parçalara bölüp vektörleştirir (document_chunks)
+Kaydetme endpoint'leri sadece satırı yazar; vektörleştirme arka plan indeksleyicisinde yapılır.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, func, case, or_
+from database import SessionLocal
+from models import Document, DocumentChunk, DocumentStatus, Source, SourceStatus, Article, VECTOR_AVAILABLE
+from services.embedding_service import generate_embeddings_batch
+from services.chunking_service import split_into_chunks, count_tokens
+from services import local_vector_index, answer_cache
+from config import settings
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import asyncio
+import logging
+import json
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_wake_event = None
+
+def _document_metadata(document: Document) -> dict:
+    return document.doc_metadata if isinstance(document.doc_metadata, dict) else {}
+
+def _document_summary(document: Document) -> str:
+    """Metadata'daki AI özeti (varsa ayrı bir parça olarak indekslenir)"""
+    return _document_metadata(document).get("ai_summary") or ""
+
+def _resolve_content(db: Session, document: Document) -> str:
+    """
+    Dokümanın içeriği. Eski /api/articles/{id}/save kayıtlarında içerik boş kalmıştı;
+    bu durumda metadata'daki URL üzerinden Article tablosundan tamamlanır.
+    """
+    if document.content:
+        return document.content
+    
+    url = _document_metadata(document).get("url")
+    if url:
+        article = db.query(Article).filter(Article.url == url).first()
+        if article and article.content:
+            document.content = article.content
+            return document.content
+    return ""
+
+def _embedding_text(title: str, chunk_text: str) -> str:
+    """Her parça başlıkla birlikte vektörleştirilir (parça tek başına bağlamsız kalmasın)"""
+    return f"{title}\n\n{chunk_text}" if title else chunk_text
+
+def _mean_embedding(embeddings: list[list[float]]) -> list:
+    """Parça vektörlerinin normalize edilmiş ortalaması (doküman seviyesi vektör)"""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    centroid = matrix.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return (centroid / norm).tolist() if norm > 0 else centroid.tolist()
+
+def _build_chunks(db: Session, document: Document) -> list[dict]:
+    chunks = split_into_chunks(_resolve_content(db, document))
+    summary = _document_summary(document)
+    if summary:
+        chunks.insert(0, {"content": summary, "token_count": count_tokens(summary)})
+    return chunks
+
+def index_documents(db: Session, documents: list[Document]) -> int:
+    """
+    Dokümanları örtüşen parçalara böler, tüm dokümanların parçalarını tek seferde
+    (batch) vektörleştirir, document_chunks tablosuna toplu yazar ve doküman
+    vektörlerini/durumlarını günceller. Commit çağıran tarafa bırakılır.
+    
+    Returns:
+        Oluşturulan toplam parça (embedding) sayısı
+    """
+    planned = []
+    for document in documents:
+        chunks = _build_chunks(db, document)
+        if chunks:
+            planned.append((document, chunks))
+        else:
+            logger.warning(f"İndekslenecek içerik yok: {document.id}")
+            document.status = DocumentStatus.error
+    
+    if not planned:
+        return 0
+    
+    texts = [
+        _embedding_text(document.title, chunk["content"])
+        for document, chunks in planned
+        for chunk in chunks
+    ]
+    embeddings = generate_embeddings_batch(texts)
+    if len(embeddings) != len(texts) or not all(embeddings):
+        raise ValueError("Parça vektörleri oluşturulamadı")
+    
+    # Doküman satırları henüz flush edilmediyse FK için önce yaz (SessionLocal autoflush=False)
+    db.flush()
+    
+    # Eski parçaları sil (yeniden indeksleme) ve yenilerini toplu ekle
+    db.query(DocumentChunk).filter(
+        DocumentChunk.document_id.in_([document.id for document, _ in planned])
+    ).delete(synchronize_session=False)
+    
+    # Bu dokümanlara dayanan cache'lenmiş cevaplar artık geçersiz
+    answer_cache.invalidate_documents(db, [document.id for document, _ in planned])
+    
+    rows = []
+    local_items = []
+    position = 0
+    for document, chunks in planned:
+        document_embeddings = embeddings[position:position + len(chunks)]
+        position += len(chunks)
+        
+        for index, (chunk, embedding) in enumerate(zip(chunks, document_embeddings)):
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "document_id": document.id,
+                "chunk_index": index,
+                "content": chunk["content"],
+                "token_count": chunk["token_count"],
+                "embedding": embedding if VECTOR_AVAILABLE else json.dumps(embedding)
+            })
+            local_items.append((rows[-1]["id"], document.id, embedding))
+        
+        document_embedding = _mean_embedding(document_embeddings)
+        document.embedding = document_embedding if VECTOR_AVAILABLE else json.dumps(document_embedding)
+        document.embeddings_count = len(chunks)
+        document.status = DocumentStatus.indexed
+        document.index_attempts = 0
+        document.next_index_at = None
+    
+    db.execute(insert(DocumentChunk), rows)
+    db.flush()
+    
+    # pgvector yoksa arama local NumPy index'inden yapılır; onu da güncelle
+    # (geri alınan transaction'ların parçaları aramada veritabanında bulunamayıp elenir)
+    if local_vector_index.is_enabled():
+        local_vector_index.get_local_index().replace_documents(
+            [document.id for document, _ in planned], local_items
+        )
+    
+    logger.info(f"{len(planned)} doküman indekslendi ({len(rows)} parça)")
+    return len(rows)
+
+def index_document(db: Session, document: Document) -> int:
+    """Tek dokümanı indeksler (bkz. index_documents)"""
+    return index_documents(db, [document])
+
+def update_source_stats(db: Session, source_ids: set):
+    """Source.total_embeddings ve progress (indekslenmiş doküman yüzdesi) değerlerini günceller"""
+    for source_id, total_docs, indexed_docs, processing_docs, total_embeddings in db.query(
+        Document.source_id,
+        func.count(Document.id),
+        func.sum(case((Document.status == DocumentStatus.indexed, 1), else_=0)),
+        func.sum(case((Document.status == DocumentStatus.processing, 1), else_=0)),
+        func.coalesce(func.sum(Document.embeddings_count), 0)
+    ).filter(
+        Document.source_id.in_(source_ids)
+    ).group_by(Document.source_id).all():
+        source = db.query(Source).filter(Source.id == source_id).first()
+        if not source:
+            continue
+        source.total_embeddings = int(total_embeddings)
+        source.progress = int(100 * (indexed_docs or 0) / total_docs) if total_docs else 100
+        source.status = SourceStatus.syncing if processing_docs else SourceStatus.active
+        source.last_sync_at = datetime.now(timezone.utc)
+
+def _schedule_retry(document: Document, error: Exception):
+    """Başarısız denemeyi sayar: INDEXER_MAX_ATTEMPTS dolana kadar artan aralıkla tekrar denenir, sonra error"""
+    document.index_attempts = (document.index_attempts or 0) + 1
+    if document.index_attempts >= settings.INDEXER_MAX_ATTEMPTS:
+        logger.error(f"Doküman indekslenemedi, denemeler tükendi ({document.id}): {error}")
+        document.status = DocumentStatus.error
+        document.next_index_at = None
+        return
+    
+    delay = settings.INDEXER_RETRY_BASE_SECONDS * 2 ** (document.index_attempts - 1)
+    document.next_index_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    logger.warning(
+        f"Doküman indekslenemedi ({document.id}), {document.index_attempts}. deneme; "
+        f"{delay} sn sonra tekrar denenecek: {error}"
+    )
+
+def index_pending_documents(db: Session, batch_size: int = None) -> int:
+    """
+    processing durumundaki dokümanlardan bir batch alır ve indeksler.
+    FOR UPDATE SKIP LOCKED sayesinde birden fazla worker aynı dokümanı işlemez.
+    Geçici hatayla biten dokümanlar processing'de kalır, next_index_at'e kadar seçilmez.
+    
+    Returns:
+        İşlenen doküman sayısı
+    """
+    batch_size = batch_size or settings.INDEXER_BATCH_SIZE
+    documents = db.query(Document).filter(
+        Document.status == DocumentStatus.processing,
+        or_(Document.next_index_at.is_(None), Document.next_index_at <= func.now())
+    ).order_by(
+        Document.created_at
+    ).limit(batch_size).with_for_update(skip_locked=True).all()
+    
+    if not documents:
+        return 0
+    
+    try:
+        with db.begin_nested():
+            index_documents(db, documents)
+    except Exception as e:
+        # Batch başarısızsa dokümanları tek tek dene; içeriksiz doküman index_documents'ta
+        # error'a çekilir, hata verenler (model/DB/OOM, geçici olabilir) sonra tekrar denenir
+        logger.warning(f"Batch indeksleme başarısız, tek tek deneniyor: {e}")
+        for document in documents:
+            try:
+                with db.begin_nested():
+                    index_document(db, document)
+            except Exception as doc_error:
+                _schedule_retry(document, doc_error)
+    
+    update_source_stats(db, {document.source_id for document in documents})
+    db.commit()
+    return len(documents)
+
+def _run_indexer_batch() -> int:
+    db = SessionLocal()
+    try:
+        return index_pending_documents(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Arka plan indeksleme hatası: {e}")
+        return 0
+    finally:
+        db.close()
+
+def notify_indexer():
+    """Yeni doküman kaydedildiğinde indeksleyiciyi beklemeden uyandırır"""
+    if _wake_event is not None:
+        _wake_event.set()
+
+async def run_background_indexer():
+    """
+    processing durumundaki dokümanları batch halinde indeksleyen döngü.
+    Embedding CPU'da çalıştığı için executor thread'inde çalıştırılır (event loop bloklanmaz).
+    """
+    global _wake_event
+    _wake_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    logger.info("Arka plan indeksleyici başlatıldı.")
+    
+    while True:
+        # Batch'ten önce temizlenir: batch sürerken gelen notify kaybolmaz, bekleme hemen biter
+        _wake_event.clear()
+        processed = await loop.run_in_executor(None, _run_indexer_batch)
+        
+        # Tam batch geldiyse kuyrukta daha fazlası olabilir, beklemeden devam et
+        if processed >= settings.INDEXER_BATCH_SIZE:
+            continue
+        
+        try:
+            await asyncio.wait_for(_wake_event.wait(), timeout=settings.INDEXER_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
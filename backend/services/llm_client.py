@@ -0,0 +1,154 @@
+"""
+LLM Client - Ollama için paylaşılan async istemci
+Tek bir httpx.AsyncClient (keep-alive bağlantı havuzu) üzerinden çalışır; LLM çağrıları
+event loop'u bloklamaz. Model başına semaphore ile aynı anda çalışan üretim sayısı
+sınırlanır (CPU'da paralel üretim hepsini yavaşlatır), fazlası sırada bekler.
+"""
+from config import settings
+import httpx
+import asyncio
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+class LLMError(Exception):
+    """Ollama'ya ulaşılamadı, zaman aşımı ya da Ollama hata döndü"""
+
+_client = None
+_semaphores = {}
+_stats = {"requests": 0, "errors": 0, "queue_timeouts": 0, "in_flight": 0, "waiting": 0}
+_loaded_models = set()  # Başarılı cevap vermiş (Ollama'da yüklenmiş) modeller
+
+def _base_url() -> str:
+    host = settings.OLLAMA_HOST.rstrip("/")
+    # Ollama CLI'daki gibi "0.0.0.0:11434" şeklinde de verilebilir
+    return host if "://" in host else f"http://{host}"
+
+def get_client() -> httpx.AsyncClient:
+    """Process genelinde paylaşılan HTTP istemcisi (lazy, bağlantılar yeniden kullanılır)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=_base_url(),
+            timeout=httpx.Timeout(settings.OLLAMA_TIMEOUT_SECONDS, connect=settings.OLLAMA_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+def _semaphore(model: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(model)
+    if semaphore is None:
+        semaphore = _semaphores[model] = asyncio.Semaphore(settings.OLLAMA_MAX_CONCURRENCY)
+    return semaphore
+
+class _Slot:
+    """Model semaphore'undan yer alır; sırada bekleme süresi OLLAMA_QUEUE_TIMEOUT_SECONDS ile sınırlı"""
+
+    def __init__(self, model: str):
+        self.semaphore = _semaphore(model)
+
+    async def __aenter__(self):
+        _stats["waiting"] += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=settings.OLLAMA_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            _stats["queue_timeouts"] += 1
+            raise LLMError("LLM kuyruğunda bekleme zaman aşımı")
+        finally:
+            _stats["waiting"] -= 1
+        _stats["in_flight"] += 1
+        _stats["requests"] += 1
+
+    async def __aexit__(self, *exc):
+        _stats["in_flight"] -= 1
+        self.semaphore.release()
+
+def _payload(model: str, prompt: str, stream: bool, system: str = None, context: list = None, options: dict = None) -> dict:
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        # Model çağrılar arasında bellekte kalsın (her istekte yeniden yüklenmesin)
+        "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+        # Context penceresi açıkça verilir (Ollama varsayılanı küçüktür, sohbet context'i kesilir)
+        "options": {"num_ctx": settings.OLLAMA_NUM_CTX, **(options or {})}
+    }
+    if system:
+        payload["system"] = system
+    if context:
+        payload["context"] = context
+    return payload
+
+async def generate(prompt: str, model: str = None, system: str = None, context: list = None, options: dict = None) -> dict:
+    """
+    Tek seferde cevap üretir (Ollama /api/generate, stream=False).
+
+    Returns:
+        Ollama cevabı: {"response": str, "context": [...], "eval_count": int, ...}
+    Raises:
+        LLMError
+    """
+    model = model or settings.OLLAMA_MODEL
+    async with _Slot(model):
+        try:
+            response = await get_client().post(
+                "/api/generate",
+                json=_payload(model, prompt, False, system, context, options)
+            )
+            response.raise_for_status()
+            _loaded_models.add(model)
+            return response.json()
+        except httpx.HTTPError as e:
+            _stats["errors"] += 1
+            raise LLMError(f"Ollama isteği başarısız: {e}") from e
+
+async def generate_stream(prompt: str, model: str = None, system: str = None, context: list = None, options: dict = None):
+    """
+    Cevabı Ollama ürettikçe parça parça döner (async generator).
+    Her parça: {"response": str, "done": bool, ...}; son parçada süre/token ölçümleri ve context bulunur.
+    """
+    model = model or settings.OLLAMA_MODEL
+    async with _Slot(model):
+        try:
+            async with get_client().stream(
+                "POST", "/api/generate",
+                json=_payload(model, prompt, True, system, context, options)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    part = json.loads(line)
+                    if "error" in part:
+                        raise LLMError(part["error"])
+                    _loaded_models.add(model)
+                    yield part
+        except httpx.HTTPError as e:
+            _stats["errors"] += 1
+            raise LLMError(f"Ollama isteği başarısız: {e}") from e
+
+def is_model_loaded(model: str = None) -> bool:
+    """Model bu process'te en az bir kez başarıyla cevap verdi mi (warm-up ya da normal istek)"""
+    return (model or settings.OLLAMA_MODEL) in _loaded_models
+
+async def warmup(model: str = None):
+    """Modeli Ollama'da belleğe yükler (boş prompt cevap üretmez, sadece yükler)"""
+    await generate("", model=model)
+
+def get_llm_stats() -> dict:
+    return {
+        "host": _base_url(),
+        "model": settings.OLLAMA_MODEL,
+        "max_concurrency": settings.OLLAMA_MAX_CONCURRENCY,
+        **_stats
+    }
@@ -0,0 +1,308 @@
+"""
+Local Vector Index - pgvector olmayan kurulumlar için process içi NumPy vektör index'i
+Parça vektörleri diskte float32, memory-mapped bir matriste tutulur (satır = parça).
+Arama: normalize vektörlerde matris-vektör çarpımı (cosine similarity) + argpartition ile top-k.
+Silinen/yeniden indekslenen parçalar tombstone olarak kalır; oranı büyüyünce dosya sıkıştırılır.
+
+Birden fazla worker aynı dosyaları paylaşır: yazmalar dosya kilidiyle sıralanır,
+diğer worker'lar meta dosyası değişince kendi görünümlerini yeniden yükler.
+"""
+from contextlib import contextmanager
+from models import DocumentChunk, VECTOR_AVAILABLE
+from config import settings
+import numpy as np
+import threading
+import logging
+import json
+import os
+
+try:
+    import fcntl  # Windows'ta yok: tek process varsayılır
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 384
+INITIAL_CAPACITY = 1024
+COMPACT_RATIO = 0.25  # Tombstone oranı bunu geçince dosya sıkıştırılır
+REBUILD_BATCH_SIZE = 5000
+
+class LocalVectorIndex:
+    """
+    Disk destekli (np.memmap) vektör index'i. Tüm metotlar thread-safe.
+    search() -> [(chunk_id, document_id, similarity), ...] (en benzerden başlayarak)
+    """
+
+    def __init__(self, directory: str, dimension: int = EMBEDDING_DIMENSION):
+        self.directory = directory
+        self.dimension = dimension
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._ids = []  # satır -> parça id (silinmişse None)
+        self._document_ids = []  # satır -> doküman id
+        self._rows = {}  # parça id -> satır
+        self._live = np.zeros(0, dtype=bool)
+        self._meta_mtime = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # --- Dosya yönetimi ---
+
+    @contextmanager
+    def _file_lock(self):
+        """Process'ler arası yazma kilidi"""
+        with open(self._lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _capacity(self) -> int:
+        return self._matrix.shape[0] if self._matrix is not None else 0
+
+    def _open_matrix(self, capacity: int):
+        self._matrix = None
+        size = capacity * self.dimension * 4
+        current = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        if current < size:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(size)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _load(self):
+        meta = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+
+        self._ids = meta.get("ids", [])
+        self._document_ids = meta.get("document_ids", [])
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids) if chunk_id}
+        self._live = np.array([chunk_id is not None for chunk_id in self._ids], dtype=bool)
+        self._open_matrix(max(meta.get("capacity", INITIAL_CAPACITY), len(self._ids), 1))
+
+    def _refresh(self):
+        """Başka bir process index'i değiştirdiyse yeniden yükle"""
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._meta_mtime:
+            self._load()
+
+    def _save(self):
+        self._matrix.flush()
+        meta = {
+            "dimension": self.dimension,
+            "capacity": self._capacity(),
+            "ids": self._ids,
+            "document_ids": self._document_ids
+        }
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+        self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity():
+            return
+        self._matrix.flush()
+        self._open_matrix(max(rows, self._capacity() * 2))
+
+    # --- Güncelleme ---
+
+    def _remove_rows(self, rows: list[int]):
+        for row in rows:
+            chunk_id = self._ids[row]
+            if chunk_id is not None:
+                self._rows.pop(chunk_id, None)
+                self._ids[row] = None
+                self._live[row] = False
+                self._matrix[row] = 0.0
+
+    def _append(self, items: list[tuple]):
+        if not items:
+            return
+        self._remove_rows([self._rows[chunk_id] for chunk_id, _, _ in items if chunk_id in self._rows])
+
+        start = len(self._ids)
+        self._ensure_capacity(start + len(items))
+        vectors = np.asarray([embedding for _, _, embedding in items], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._matrix[start:start + len(items)] = vectors / np.where(norms > 0, norms, 1.0)
+
+        for offset, (chunk_id, document_id, _) in enumerate(items):
+            self._ids.append(chunk_id)
+            self._document_ids.append(document_id)
+            self._rows[chunk_id] = start + offset
+        self._live = np.concatenate([self._live, np.ones(len(items), dtype=bool)])
+
+    def _compact_if_needed(self):
+        total = len(self._ids)
+        if not total or (total - len(self._rows)) / total < COMPACT_RATIO:
+            return
+
+        live_rows = np.flatnonzero(self._live)
+        vectors = np.array(self._matrix[live_rows])
+        ids = [self._ids[row] for row in live_rows]
+        document_ids = [self._document_ids[row] for row in live_rows]
+
+        # Yeni dosyayı yan tarafta yaz, sonra atomik olarak değiştir
+        capacity = max(INITIAL_CAPACITY, len(ids) * 2)
+        tmp_path = f"{self._vectors_path}.tmp"
+        compacted = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dimension))
+        compacted[:len(ids)] = vectors
+        compacted.flush()
+        del compacted
+        self._matrix = None
+        os.replace(tmp_path, self._vectors_path)
+
+        self._ids = ids
+        self._document_ids = document_ids
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self._live = np.ones(len(ids), dtype=bool)
+        self._open_matrix(capacity)
+        logger.info(f"Local vektör index'i sıkıştırıldı ({len(ids)} parça)")
+
+    def replace_documents(self, document_ids: list[str], items: list[tuple]):
+        """
+        Dokümanların eski parçalarını siler, yenilerini ekler.
+        items: [(chunk_id, document_id, embedding), ...]
+        """
+        targets = set(document_ids)
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._remove_rows([row for row, doc_id in enumerate(self._document_ids) if doc_id in targets and self._live[row]])
+            self._append(items)
+            self._compact_if_needed()
+            self._save()
+
+    def remove_documents(self, document_ids: list[str]):
+        self.replace_documents(document_ids, [])
+
+    def rebuild(self, batches):
+        """Index'i sıfırdan kurar. batches: [(chunk_id, document_id, embedding), ...] listeleri"""
+        with self._lock, self._file_lock():
+            self._matrix = None
+            for path in (self._vectors_path, self._meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._meta_mtime = None
+            self._load()
+            for items in batches:
+                self._append(items)
+            self._save()
+
+    # --- Arama ---
+
+    def search(self, query_vector: list, k: int, document_ids: set = None) -> list[tuple]:
+        """document_ids verilirse sadece bu dokümanların parçaları aranır (metadata filtresi)"""
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            if not count or not self._rows or k <= 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            live = self._live
+            if document_ids is not None:
+                live = live & np.fromiter((doc_id in document_ids for doc_id in self._document_ids), dtype=bool, count=count)
+
+            scores = self._matrix[:count] @ query
+            scores[~live] = -np.inf
+
+            k = min(k, int(live.sum()))
+            if k <= 0:
+                return []
+            if k < count:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(count)
+            top = top[np.argsort(-scores[top])]
+
+            return [
+                (self._ids[row], self._document_ids[row], float(scores[row]))
+                for row in top if live[row]
+            ]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "vectors": len(self._rows),
+                "rows": len(self._ids),
+                "capacity": self._capacity(),
+                "size_bytes": self._capacity() * self.dimension * 4
+            }
+
+# --- Uygulama entegrasyonu ---
+
+_index = None
+_index_lock = threading.Lock()
+
+def is_enabled() -> bool:
+    """VECTOR_SEARCH_BACKEND=local ya da auto iken pgvector yoksa local index kullanılır"""
+    backend = (settings.VECTOR_SEARCH_BACKEND or "auto").lower()
+    return backend == "local" or (backend == "auto" and not VECTOR_AVAILABLE)
+
+def _parse_embedding(value):
+    """pgvector yoksa vektörler Text kolonunda JSON olarak durur"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def _database_batches(db):
+    query = db.query(
+        DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.embedding
+    ).filter(
+        DocumentChunk.embedding.isnot(None)
+    ).yield_per(REBUILD_BATCH_SIZE)
+
+    batch = []
+    for chunk_id, document_id, embedding in query:
+        batch.append((chunk_id, document_id, _parse_embedding(embedding)))
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def sync_from_database(index: LocalVectorIndex):
+    """Index'teki parça sayısı veritabanıyla uyuşmuyorsa (ilk kurulum, dış değişiklik) yeniden kur"""
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        expected = db.query(DocumentChunk.id).filter(DocumentChunk.embedding.isnot(None)).count()
+        if expected == len(index):
+            return
+        logger.info(f"Local vektör index'i yeniden kuruluyor ({len(index)} -> {expected} parça)...")
+        index.rebuild(_database_batches(db))
+        logger.info(f"Local vektör index'i hazır ({len(index)} parça)")
+    finally:
+        db.close()
+
+def get_local_index() -> LocalVectorIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = LocalVectorIndex(settings.LOCAL_VECTOR_INDEX_DIR)
+                sync_from_database(index)
+                _index = index
+    return _index
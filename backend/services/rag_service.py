@@ -3,93 +3,587 @@ RAG (Retrieval-Augmented Generation) Servisi
 Semantic search + LLM ile akıllı sohbet
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from models import Document
-from services.embedding_service import generate_embedding
+from sqlalchemy import select, values, column, func, cast, literal, null, true, false, or_, Text, Float, Integer
+from sqlalchemy.dialects.postgresql import TSQUERY
+from database import SessionLocal
+from models import Document, DocumentChunk, TEXT_SEARCH_CONFIG, Vector
+from services.embedding_service import generate_query_embedding, generate_query_embedding_async
+from services import local_vector_index, llm_client, answer_cache, conversation_service
+from services.rerank_service import score_passages
+from services.context_builder import select_passages
+from services.vector_index import EMBEDDING_DIMENSION, distance_expression, similarity_expression, similarity_from_distance, quantized_distance, candidate_count, index_scan_limit, apply_search_settings
+from config import settings
+from contextlib import aclosing
+import numpy as np
 import logging
+import asyncio
 import json
+import time
 
 logger = logging.getLogger(__name__)
 
-def search_similar_documents(db: Session, query: str, limit: int = 3):
+# Doküman başına birden fazla parça dönebileceği için daha geniş aday kümesi çekilir
+CHUNK_CANDIDATE_FACTOR = 5
+
+# Parçası olmayan (eski) dokümanlarda LLM'e gidecek içerik
+LEGACY_CONTENT_CHARS = 1500
+
+def _document_filters(filters: dict) -> list:
+    """
+    Metadata filtreleri -> documents tablosu üzerinde SQL koşulları (vektör sıralamasıyla aynı sorguda).
+    Kategori (->> expression index) ve etiket (@> GIN index) koşulları index'lerle eşleşir.
+    """
+    if not filters:
+        return []
+    
+    conditions = []
+    if filters.get("categories"):
+        conditions.append(Document.doc_metadata["category"].astext.in_(filters["categories"]))
+    tags = [tag.replace("#", "").strip() for tag in filters.get("tags") or [] if tag and tag.strip("# ")]
+    if tags:
+        conditions.append(or_(*[Document.doc_metadata.contains({"all_tags": [tag]}) for tag in tags]))
+    if filters.get("source_ids"):
+        conditions.append(Document.source_id.in_(filters["source_ids"]))
+    if filters.get("date_from"):
+        conditions.append(Document.created_at >= filters["date_from"])
+    if filters.get("date_to"):
+        conditions.append(Document.created_at < filters["date_to"])
+    return conditions
+
+def _chunk_filters(filters: dict) -> list:
+    """Aynı filtreler parça tablosu için (filtreye uyan dokümanların parçaları)"""
+    conditions = _document_filters(filters)
+    if not conditions:
+        return []
+    return [DocumentChunk.document_id.in_(select(Document.id).where(*conditions))]
+
+def _apply_relevance_cutoff(rows: list, adaptive: bool = True) -> list:
+    """
+    Alakasız parçaları eler: RAG_MIN_SIMILARITY altı ve (adaptive ise) en iyi sonuçtan
+    RAG_SIMILARITY_MARGIN'den fazla geride kalanlar (adaptive k). Full-text sıralamasında
+    ilk HYBRID_LEXICAL_KEEP_RANK içindeki parçalar (örn. SAP kodu) vektör benzerliği düşük
+    olsa da tutulur; OR'lu tsquery ile tek kelimesi tutan diğer parçalara eşik uygulanır.
+    """
+    scored = [row["similarity"] for row in rows if row["similarity"] is not None]
+    if not scored:
+        return rows
+    threshold = settings.RAG_MIN_SIMILARITY
+    if adaptive:
+        threshold = max(threshold, max(scored) - settings.RAG_SIMILARITY_MARGIN)
+    return [
+        row for row in rows
+        if row["lexical_match"] or (row["similarity"] is not None and row["similarity"] >= threshold)
+    ]
+
+def _collapse_chunks(rows: list, limit: int, chunks_per_document: int = None) -> list:
+    """
+    Sıralı parça satırlarını dokümanlara indirger (sıra korunur).
+    Her doküman için en fazla chunks_per_document (varsayılan RAG_CHUNKS_PER_DOCUMENT) parça tutulur.
+    """
+    chunks_per_document = chunks_per_document or settings.RAG_CHUNKS_PER_DOCUMENT
+    results = {}
+    for row in rows:
+        hit = results.get(row["document_id"])
+        if hit is None:
+            if len(results) >= limit:
+                continue
+            hit = results[row["document_id"]] = {
+                "id": row["document_id"],
+                "title": row["title"],
+                "url": row["url"],
+                "similarity": row["similarity"],
+                "chunks": []
+            }
+        if len(hit["chunks"]) < chunks_per_document:
+            hit["chunks"].append({
+                "chunk_index": row["chunk_index"],
+                "content": row["content"],
+                "similarity": row["similarity"]
+            })
+
+    # LLM'e metin sırasıyla gönderilsin
+    for hit in results.values():
+        hit["chunks"].sort(key=lambda c: c["chunk_index"])
+    return list(results.values())
+
+def _vector_candidates(model, query_vector: list, k: int, *filters):
+    """
+    En yakın k satır: (id, distance). ANN index varsa ORDER BY ... LIMIT onu kullanır.
+    Quantize mod açıksa önce halfvec/binary index'ten aday kümesi alınır,
+    sonra sadece bu adaylar tam vektörle sıralanır.
+    """
+    return _vector_candidates_select(model, query_vector, k, *filters).subquery()
+
+def _vector_candidates_select(model, query_vector, k: int, *filters):
+    """_vector_candidates sorgusu (subquery/lateral'a çevrilmemiş; query_vector bir kolon da olabilir)"""
+    distance = distance_expression(model.embedding, query_vector)
+    stmt = select(model.id, distance.label("distance")).where(model.embedding.isnot(None), *filters)
+    
+    first_pass = quantized_distance(model.embedding, query_vector)
+    if first_pass is not None:
+        candidates = select(model.id).where(
+            model.embedding.isnot(None), *filters
+        ).order_by(first_pass).limit(candidate_count(k))
+        stmt = stmt.where(model.id.in_(candidates))
+    
+    return stmt.order_by(distance).limit(k)
+
+def _text_query(query: str):
     """
-    Soruyu vektöre çevirir ve veritabanında en yakın dokümanları bulur.
-    PGVector'ın 'cosine distance' operatörünü kullanır.
+    Sorgu kelimelerinden OR'lu tsquery. Doğal dil sorularında tüm kelimelerin geçmesi
+    gerekmesin; çok kelime eşleşen satırlar ts_rank_cd ile zaten üste çıkar.
     """
+    plain = func.plainto_tsquery(TEXT_SEARCH_CONFIG, query)
+    return cast(func.replace(cast(plain, Text), " & ", " | "), TSQUERY)
+
+def _lexical_candidates(model, query: str, k: int, *filters):
+    """Full-text (GIN index) ile en iyi k satır: (id, score)"""
+    tsquery = _text_query(query)
+    score = func.ts_rank_cd(model.search_vector, tsquery)
+    return select(model.id, score.label("score")).where(
+        model.search_vector.op("@@")(tsquery), *filters
+    ).order_by(score.desc()).limit(k).subquery()
+
+def _hybrid_candidates(model, query: str, query_vector: list, k: int, *filters):
+    """
+    Vektör ve full-text sıralamalarını Reciprocal Rank Fusion ile birleştirir:
+    score = 1/(RRF_K + vektör sırası) + 1/(RRF_K + metin sırası). Tek SQL sorgusu.
+    """
+    branch_k = max(k, settings.HYBRID_CANDIDATES)
+    vector = _vector_candidates(model, query_vector, branch_k, *filters)
+    lexical = _lexical_candidates(model, query, branch_k, *filters)
+    
+    vector_ranked = select(
+        vector.c.id, vector.c.distance, func.row_number().over(order_by=vector.c.distance).label("rank")
+    ).subquery()
+    lexical_ranked = select(
+        lexical.c.id, func.row_number().over(order_by=lexical.c.score.desc()).label("rank")
+    ).subquery()
+    
+    rrf_k = settings.HYBRID_RRF_K
+    score = (
+        func.coalesce(1.0 / (rrf_k + vector_ranked.c.rank), 0.0) +
+        func.coalesce(1.0 / (rrf_k + lexical_ranked.c.rank), 0.0)
+    )
+    return select(
+        func.coalesce(vector_ranked.c.id, lexical_ranked.c.id).label("id"),
+        score.label("score"),
+        vector_ranked.c.distance,
+        func.coalesce(lexical_ranked.c.rank <= settings.HYBRID_LEXICAL_KEEP_RANK, False).label("lexical_match")
+    ).select_from(
+        vector_ranked.join(lexical_ranked, vector_ranked.c.id == lexical_ranked.c.id, full=True)
+    ).order_by(score.desc()).limit(k).subquery()
+
+def _chunk_rows(db: Session, candidates, order_by, similarity, lexical_match) -> list:
+    """
+    Aday parçaları aday sırasıyla, sadece gereken kolonlarla çeker
+    (ORM nesnesi ve 384 boyutlu vektör yüklenmez). Aynı sorguda benzerlik skoru da gelir.
+    """
+    stmt = select(
+        DocumentChunk.id.label("chunk_id"),
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_index,
+        DocumentChunk.content,
+        DocumentChunk.token_count,
+        Document.title,
+        Document.doc_metadata["url"].astext.label("url"),
+        similarity.label("similarity"),
+        lexical_match.label("lexical_match")
+    ).join(
+        candidates, DocumentChunk.id == candidates.c.id
+    ).join(
+        Document, Document.id == DocumentChunk.document_id
+    ).order_by(order_by)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+def _lexical_rows(db: Session, query: str, k: int, limit: int, filters: dict = None) -> list:
+    """Sadece full-text arama (vektör araması kullanılamadığında; benzerlik skoru yok)"""
+    candidates = _lexical_candidates(DocumentChunk, query, k, *_chunk_filters(filters))
+    rows = _chunk_rows(db, candidates, candidates.c.score.desc(), cast(null(), Float), true())
+    if rows:
+        return rows
+    
+    candidates = _lexical_candidates(Document, query, limit, Document.content.isnot(None), *_document_filters(filters))
+    return _legacy_rows(db, candidates, candidates.c.score.desc(), cast(null(), Float))
+
+def _legacy_rows(db: Session, candidates, order_by, similarity) -> list:
+    """Parçası olmayan (eski) dokümanlar: içeriğin başı tek parça gibi döner"""
+    stmt = select(
+        cast(null(), Text).label("chunk_id"),
+        Document.id.label("document_id"),
+        literal(0).label("chunk_index"),
+        func.left(Document.content, LEGACY_CONTENT_CHARS).label("content"),
+        cast(null(), Integer).label("token_count"),
+        Document.title,
+        Document.doc_metadata["url"].astext.label("url"),
+        similarity.label("similarity"),
+        false().label("lexical_match")
+    ).join(
+        candidates, Document.id == candidates.c.id
+    ).order_by(order_by)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+def _reciprocal_rank_fusion(*rankings) -> list:
+    """Sıralı id listelerini RRF skoruna göre birleştirir (SQL tarafındaki _hybrid_candidates ile aynı formül)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (settings.HYBRID_RRF_K + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _local_rows(db: Session, query: str, query_vector: list, k: int, filters: dict = None) -> list:
+    """
+    pgvector olmayan kurulumlar: vektör adayları process içi NumPy index'inden gelir,
+    hibrit modda full-text sıralamasıyla Python'da RRF ile birleştirilir.
+    Filtre varsa uyan dokümanlar SQL'den alınır, index sadece onların satırlarında arar.
+    """
+    hybrid = settings.RETRIEVAL_MODE == "hybrid"
+    branch_k = max(k, settings.HYBRID_CANDIDATES) if hybrid else k
+    
+    document_ids = None
+    conditions = _document_filters(filters)
+    if conditions:
+        document_ids = set(db.execute(select(Document.id).where(*conditions)).scalars())
+        if not document_ids:
+            return []
+    
+    similarities = {
+        chunk_id: similarity
+        for chunk_id, _, similarity in local_vector_index.get_local_index().search(query_vector, branch_k, document_ids)
+    }
+    ranking = list(similarities)
+    lexical_ids = set()
+    if hybrid:
+        lexical = _lexical_candidates(DocumentChunk, query, branch_k, *_chunk_filters(filters))
+        lexical_ranking = db.execute(select(lexical.c.id)).scalars().all()
+        lexical_ids = set(lexical_ranking[:settings.HYBRID_LEXICAL_KEEP_RANK])
+        ranking = _reciprocal_rank_fusion(ranking, lexical_ranking)[:k]
+    
+    if not ranking:
+        return []
+    
+    # Index'te olup veritabanında olmayan (silinmiş/geri alınmış) parçalar burada elenir
+    positions = {chunk_id: position for position, chunk_id in enumerate(ranking)}
+    rows = db.execute(select(
+        DocumentChunk.id.label("chunk_id"),
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_index,
+        DocumentChunk.content,
+        DocumentChunk.token_count,
+        Document.title,
+        Document.doc_metadata["url"].astext.label("url")
+    ).join(
+        Document, Document.id == DocumentChunk.document_id
+    ).where(DocumentChunk.id.in_(ranking))).all()
+    
+    return sorted(
+        (
+            {**row._mapping, "similarity": similarities.get(row.chunk_id), "lexical_match": row.chunk_id in lexical_ids}
+            for row in rows
+        ),
+        key=lambda row: positions[row["chunk_id"]]
+    )
+
+def _rerank(query: str, rows: list, limit: int) -> list:
+    """
+    Aday parçaları cross-encoder ile tek batch'te yeniden puanlar; en iyi parçalar
+    RERANK_CONTEXT_TOKENS bütçesi ve limit doküman dolana kadar seçilir.
+    """
+    if not rows:
+        return []
+    
+    scores = score_passages(query, [row["content"] for row in rows])
+    ranked = sorted(zip(scores, rows), key=lambda pair: pair[0], reverse=True)
+    
+    selected = []
+    documents = set()
+    budget = settings.RERANK_CONTEXT_TOKENS
+    for score, row in ranked:
+        if row["document_id"] not in documents and len(documents) >= limit:
+            continue
+        tokens = row["token_count"] or len(row["content"]) // 4
+        # En iyi parça bütçeyi tek başına aşsa da gönderilir (hiç kaynak kalmasın diye)
+        if selected and tokens > budget:
+            continue
+        documents.add(row["document_id"])
+        selected.append({**row, "rerank_score": score})
+        budget -= tokens
+    
+    hits = _collapse_chunks(selected, limit)
+    best_scores = {}
+    for row in selected:
+        best_scores.setdefault(row["document_id"], row["rerank_score"])
+    for hit in hits:
+        hit["rerank_score"] = best_scores[hit["id"]]
+    return hits
+
+def search_similar_documents(db: Session, query: str, limit: int = 3, query_vector: list = None, rerank: bool = None, filters: dict = None):
+    """
+    Soruya en alakalı dokümanları (ve içlerindeki en alakalı parçaları) bulur.
+    RETRIEVAL_MODE="hybrid": vektör + Türkçe full-text sıralaması RRF ile birleştirilir
+    (ürün adı, SAP kodu gibi anahtar kelime ağırlıklı sorular için).
+    RETRIEVAL_MODE="vector": sadece cosine distance (veya normalize vektörlerde iç çarpım).
+    pgvector yoksa (VECTOR_SEARCH_BACKEND) vektör araması local NumPy index'inden yapılır.
+    
+    Benzerliği RAG_MIN_SIMILARITY altında kalan ve en iyi sonuçtan çok geride kalan
+    parçalar elenir; limit üst sınırdır, daha az sonuç dönebilir.
+    rerank (varsayılan RERANK_ENABLED): RERANK_CANDIDATES parça cross-encoder ile yeniden sıralanır.
+    
+    query_vector verilirse (örn. async olarak önceden hesaplandıysa) tekrar vektörleştirilmez.
+    filters (kategori, etiket, kaynak, tarih; bkz. schemas.SearchFilters) vektör sıralamasıyla aynı SQL'de uygulanır.
+    
+    Returns:
+        [{"id", "title", "url", "similarity", "chunks": [{"chunk_index", "content", "similarity"}]}, ...]
+        (en alakalıdan başlayarak; similarity sadece full-text fallback'inde None,
+        rerank açıksa ayrıca "rerank_score")
+    """
+    rerank = settings.RERANK_ENABLED if rerank is None else rerank
+    # Her doküman birden fazla parçaya sahip olabilir; geniş aday kümesi çekip dokümanlara indirgiyoruz
+    k = max(settings.RERANK_CANDIDATES, limit) if rerank else limit * CHUNK_CANDIDATE_FACTOR
+    
     # 1. Soruyu Vektörleştir
-    query_vector = generate_embedding(query)
+    if query_vector is None:
+        query_vector = generate_query_embedding(query)
+
+    rows = _candidate_rows(db, query, query_vector, k, limit, filters)
+    
+    if rerank:
+        try:
+            # Margin'i cross-encoder belirlesin; sadece mutlak alt sınır uygulanır
+            return _rerank(query, _apply_relevance_cutoff(rows, adaptive=False), limit)
+        except Exception as e:
+            logger.error(f"Rerank hatası, vektör sıralaması kullanılıyor: {e}")
+    
+    return _collapse_chunks(_apply_relevance_cutoff(rows), limit)
+
+def batch_search(db: Session, query_vectors: list, limit: int = 5, filters: dict = None) -> list:
+    """
+    Çok sayıda sorgu vektörü için en yakın dokümanlar, tek SQL round trip'te:
+    vektörler VALUES listesi olarak gönderilir, her biri için parça araması
+    CROSS JOIN LATERAL ile (ANN index'i kullanarak) yapılır. LLM/rerank çağrılmaz,
+    relevance cutoff uygulanmaz. Parçası olmayan eski dokümanlar sonuçlarda yer almaz.
+    
+    Returns:
+        Her sorgu için (girdi sırasıyla) [{"id", "title", "similarity"}, ...]
+        (en yakından başlayarak; vektörü boş olan sorguda boş liste)
+    """
+    results = [[] for _ in query_vectors]
+    queries = [(index, list(vector)) for index, vector in enumerate(query_vectors) if vector]
+    if not queries:
+        return results
+    
+    k = limit * CHUNK_CANDIDATE_FACTOR
+    if local_vector_index.is_enabled():
+        rows = _local_batch_rows(db, queries, k, filters)
+    else:
+        rows = _vector_batch_rows(db, queries, k, filters)
     
-    if not query_vector:
-        logger.warning("Query embedding oluşturulamadı")
+    for row in rows:
+        hits = results[row["query_index"]]
+        if len(hits) < limit and all(hit["id"] != row["document_id"] for hit in hits):
+            hits.append({"id": row["document_id"], "title": row["title"], "similarity": row["similarity"]})
+    return results
+
+def _vector_batch_rows(db: Session, queries: list, k: int, filters: dict = None) -> list:
+    """pgvector: VALUES (sıra, vektör) x LATERAL (en yakın k parça); sorgu ve mesafe sırasıyla"""
+    chunk_filters = _chunk_filters(filters)
+    # Her LATERAL alt sorgu index'ten k (quantize modda candidate_count(k)) satır ister
+    apply_search_settings(db, filtered=bool(chunk_filters), limit=index_scan_limit(k))
+    
+    vector_type = Vector(EMBEDDING_DIMENSION)
+    query_table = values(
+        column("query_index", Integer),
+        column("embedding", vector_type),
+        name="queries"
+    ).data(queries)
+    # VALUES parametreleri tipsiz (text) gider; operatörler için vector'e çevrilir
+    query_vector = cast(query_table.c.embedding, vector_type)
+    candidates = _vector_candidates_select(
+        DocumentChunk, query_vector, k, *chunk_filters
+    ).correlate(query_table).lateral("candidates")
+    
+    stmt = select(
+        query_table.c.query_index,
+        DocumentChunk.document_id,
+        Document.title,
+        similarity_from_distance(candidates.c.distance).label("similarity")
+    ).select_from(query_table).join(
+        candidates, true()
+    ).join(
+        DocumentChunk, DocumentChunk.id == candidates.c.id
+    ).join(
+        Document, Document.id == DocumentChunk.document_id
+    ).order_by(query_table.c.query_index, candidates.c.distance)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+def _local_batch_rows(db: Session, queries: list, k: int, filters: dict = None) -> list:
+    """pgvector olmayan kurulumlar: aramalar process içi index'te, başlıklar tek sorguda"""
+    document_ids = None
+    conditions = _document_filters(filters)
+    if conditions:
+        document_ids = set(db.execute(select(Document.id).where(*conditions)).scalars())
+        if not document_ids:
+            return []
+    
+    index = local_vector_index.get_local_index()
+    matches = [
+        (query_index, chunk_id, similarity)
+        for query_index, vector in queries
+        for chunk_id, _, similarity in index.search(vector, k, document_ids)
+    ]
+    if not matches:
         return []
+    
+    # Index'te olup veritabanında olmayan (silinmiş) parçalar burada elenir
+    chunks = {
+        row.id: row
+        for row in db.execute(select(
+            DocumentChunk.id, DocumentChunk.document_id, Document.title
+        ).join(
+            Document, Document.id == DocumentChunk.document_id
+        ).where(DocumentChunk.id.in_({chunk_id for _, chunk_id, _ in matches})))
+    }
+    return [
+        {"query_index": query_index, "document_id": chunks[chunk_id].document_id,
+         "title": chunks[chunk_id].title, "similarity": similarity}
+        for query_index, chunk_id, similarity in matches if chunk_id in chunks
+    ]
 
+def _candidate_rows(db: Session, query: str, query_vector: list, k: int, limit: int, filters: dict = None) -> list:
+    """Aday parça satırları (arama sırasıyla); vektör araması başarısız olursa full-text"""
     try:
-        # 2. Vektör Araması (Cosine Distance)
-        # Document.embedding ile sorgu vektörü arasındaki mesafeye göre sırala
-        # pgvector'da cosine_distance operatörü kullanıyoruz
-        results = db.query(Document).filter(
-            Document.embedding.isnot(None),
-            Document.content.isnot(None)
-        ).order_by(
-            Document.embedding.cosine_distance(query_vector)
-        ).limit(limit).all()
-        
-        return results
+        if not query_vector:
+            logger.warning("Query embedding oluşturulamadı, full-text aramaya geçiliyor")
+            return _lexical_rows(db, query, k, limit, filters)
+        if local_vector_index.is_enabled():
+            return _local_rows(db, query, query_vector, k, filters)
+        return _vector_rows(db, query, query_vector, k, limit, filters)
     except Exception as e:
         logger.error(f"Vector search hatası: {e}")
-        # Fallback: Basit text search
+        # Fallback: Full-text arama (GIN index)
         try:
-            results = db.query(Document).filter(
-                Document.content.isnot(None),
-                Document.content.ilike(f"%{query}%")
-            ).limit(limit).all()
-            return results
+            db.rollback()
+            return _lexical_rows(db, query, k, limit, filters)
         except Exception as fallback_error:
             logger.error(f"Fallback search hatası: {fallback_error}")
             return []
 
+def _vector_rows(db: Session, query: str, query_vector: list, k: int, limit: int, filters: dict = None) -> list:
+    """pgvector araması: parçalar, parçası olmayan eski kayıtlarda doküman seviyesi"""
+    chunk_filters = _chunk_filters(filters)
+    hybrid = settings.RETRIEVAL_MODE == "hybrid"
+    # Hibrit modda vektör dalı max(k, HYBRID_CANDIDATES) satır ister (bkz. _hybrid_candidates)
+    scan_k = max(k, settings.HYBRID_CANDIDATES) if hybrid else k
+    apply_search_settings(db, filtered=bool(chunk_filters), limit=index_scan_limit(scan_k))
+    
+    if hybrid:
+        candidates = _hybrid_candidates(DocumentChunk, query, query_vector, k, *chunk_filters)
+        # Vektör dalından gelen satırlarda sıralamada hesaplanan mesafe kullanılır;
+        # tam vektör mesafesi sadece yalnız full-text'ten gelen satırlar için hesaplanır
+        similarity = func.coalesce(
+            similarity_from_distance(candidates.c.distance),
+            similarity_expression(DocumentChunk.embedding, query_vector)
+        )
+        rows = _chunk_rows(db, candidates, candidates.c.score.desc(), similarity, candidates.c.lexical_match)
+    else:
+        candidates = _vector_candidates(DocumentChunk, query_vector, k, *chunk_filters)
+        rows = _chunk_rows(db, candidates, candidates.c.distance, similarity_from_distance(candidates.c.distance), false())
+    
+    if rows:
+        return rows
+    
+    # Henüz parçalanmamış (eski) dokümanlar için doküman seviyesi arama
+    candidates = _vector_candidates(Document, query_vector, limit, Document.content.isnot(None), *_document_filters(filters))
+    return _legacy_rows(db, candidates, candidates.c.distance, similarity_from_distance(candidates.c.distance))
 
-async def chat_with_data(db: Session, user_message: str):
+def _row_embeddings(db: Session, rows: list) -> np.ndarray:
     """
-    RAG Pipeline: Retrieval -> Augmentation -> Generation
+    Aday satırların vektörleri (satır sırasıyla): parçalarda parça vektörü, eski dokümanlarda
+    doküman vektörü. Sadece seçilmiş birkaç düzine aday için, id ile çekilir.
     """
-    # 1. İlgili Dokümanları Bul (Retrieval)
-    relevant_docs = search_similar_documents(db, user_message, limit=3)
+    chunk_ids = [row["chunk_id"] for row in rows if row["chunk_id"]]
+    document_ids = [row["document_id"] for row in rows if not row["chunk_id"]]
     
-    if not relevant_docs:
-        return {
-            "answer": "Üzgünüm, veritabanımda bu konuyla ilgili bir bilgi bulamadım. RSS'den yeni makaleler eklemeyi deneyebilirsin.",
-            "sources": []
-        }
+    vectors = {}
+    if chunk_ids:
+        vectors.update(db.execute(
+            select(DocumentChunk.id, DocumentChunk.embedding).where(DocumentChunk.id.in_(chunk_ids))
+        ).all())
+    if document_ids:
+        vectors.update(db.execute(
+            select(Document.id, Document.embedding).where(Document.id.in_(document_ids))
+        ).all())
+    
+    matrix = np.zeros((len(rows), EMBEDDING_DIMENSION), dtype=np.float32)
+    for position, row in enumerate(rows):
+        vector = vectors.get(row["chunk_id"] or row["document_id"])
+        if vector is not None:
+            # Vektörü olmayan aday (örn. sadece full-text eşleşmesi) hiçbir parçaya benzemez sayılır
+            matrix[position] = json.loads(vector) if isinstance(vector, str) else vector
+    return matrix
 
-    # 2. Context Oluştur
-    context_text = ""
-    sources = []
+def retrieve_context(db: Session, query: str, query_vector: list = None, rerank: bool = None, filters: dict = None) -> list:
+    """
+    LLM'e gidecek kaynaklar: CONTEXT_CANDIDATES aday parça arasından CONTEXT_MAX_TOKENS
+    bütçesi dolana kadar MMR ile (alakalı ama birbirini tekrar etmeyen) parçalar seçilir.
+    rerank açıksa alaka skoru olarak cross-encoder skorları kullanılır.
     
-    for doc in relevant_docs:
-        # İçeriği al (maksimum 1500 karakter)
-        doc_content = doc.content[:1500] if doc.content else ""
-        
-        # URL'yi metadata'dan çek
-        doc_url = None
+    Returns:
+        search_similar_documents ile aynı yapı; dokümanlar seçim sırasıyla, parçalar metin sırasıyla
+    """
+    rerank = settings.RERANK_ENABLED if rerank is None else rerank
+    if query_vector is None:
+        query_vector = generate_query_embedding(query)
+    
+    limit = settings.CONTEXT_MAX_DOCUMENTS
+    rows = _candidate_rows(db, query, query_vector, max(settings.CONTEXT_CANDIDATES, limit), limit, filters)
+    # Rerank açıksa margin'i cross-encoder belirlesin; sadece mutlak alt sınır uygulanır
+    rows = _apply_relevance_cutoff(rows, adaptive=not rerank)
+    if not rows:
+        return []
+    
+    relevance = None
+    if rerank:
         try:
-            if doc.doc_metadata:
-                metadata = json.loads(doc.doc_metadata)
-                doc_url = metadata.get('url')
-        except:
-            pass
-        
-        context_text += f"-- KAYNAK: {doc.title} --\n{doc_content}\n\n"
-        sources.append({
-            "id": doc.id,
-            "title": doc.title,
-            "url": doc_url,
-            "content": doc_content,
-            "similarity": 0.0  # Hesaplaması maliyetli ise şimdilik 0 geçebiliriz
-        })
+            relevance = score_passages(query, [row["content"] for row in rows])
+        except Exception as e:
+            logger.error(f"Rerank hatası, vektör benzerliği kullanılıyor: {e}")
+    
+    selected = select_passages(query_vector, rows, _row_embeddings(db, rows), relevance=relevance)
+    return _collapse_chunks(selected, limit, chunks_per_document=len(selected))
 
-    # 3. LLM Prompt Hazırla (Augmentation)
-    prompt = f"""Sen TUYGUN adında akıllı bir analitik asistansın.
+def _retrieve_context_in_session(query: str, query_vector: list, filters: dict = None) -> list:
+    """retrieve_context'i kendi session'ıyla çalıştırır (executor thread'i için; request session'ı thread'ler arasında paylaşılmaz)"""
+    db = SessionLocal()
+    try:
+        return retrieve_context(db, query, query_vector=query_vector, filters=filters)
+    finally:
+        db.close()
+
+async def warmup_llm():
+    """
+    Ollama'da modeli belleğe yükler (boş prompt sadece modeli yükler, cevap üretmez).
+    İlk sohbet isteği model yükleme süresini beklemez; OLLAMA_KEEP_ALIVE boyunca bellekte kalır.
+    """
+    await llm_client.warmup()
+    logger.info(f"LLM ({settings.OLLAMA_MODEL}) belleğe yüklendi.")
+
+def is_llm_ready() -> bool:
+    return llm_client.is_model_loaded()
+
+
+NO_RESULT_ANSWER = "Üzgünüm, veritabanımda bu konuyla ilgili bir bilgi bulamadım. RSS'den yeni makaleler eklemeyi deneyebilirsin."
+EMPTY_ANSWER = "Üzgünüm, şu anda cevap üretemiyorum. Lütfen tekrar deneyin."
+LLM_ERROR_ANSWER = "Üzgünüm, AI servisi şu anda kullanılamıyor. Lütfen daha sonra tekrar deneyin."
+
+def _build_prompt(context_text: str, user_message: str, conversation: dict = None) -> str:
+    history = ""
+    if conversation and conversation["summary"]:
+        history += f"SOHBET ÖZETİ:\n{conversation['summary']}\n\n"
+    if conversation and conversation["messages"]:
+        history += f"ÖNCEKİ MESAJLAR:\n{conversation_service.format_messages(conversation['messages'])}\n\n"
+    
+    return f"""Sen TUYGUN adında akıllı bir analitik asistansın.
 Aşağıdaki "KAYNAK BİLGİLER"i kullanarak kullanıcının sorusunu cevapla.
 
 KURALLAR:
@@ -98,6 +592,18 @@ KURALLAR:
 3. Kaynaklarda bilgi yoksa "Bilmiyorum" de.
 4. Cevabını kısa ve öz tut (maksimum 5-6 cümle).
 
+{history}KAYNAK BİLGİLER:
+{context_text}
+
+KULLANICI SORUSU:
+{user_message}
+
+CEVAP:"""
+
+def _build_followup_prompt(context_text: str, user_message: str) -> str:
+    """Ollama context'i ile devam eden sohbet: talimatlar ve önceki turlar context'te, sadece yeni tur yazılır"""
+    return f"""Aynı kurallarla sohbete devam et. Yeni soruyu aşağıdaki kaynaklara ve önceki konuşmaya göre cevapla.
+
 KAYNAK BİLGİLER:
 {context_text}
 
@@ -106,23 +612,201 @@ KULLANICI SORUSU:
 
 CEVAP:"""
 
+async def _prepare_chat(user_message: str, conversation: dict = None, filters: dict = None):
+    """
+    Retrieval + Augmentation: (prompt, sources, query_vector). İlgili kaynak yoksa prompt None döner.
+    conversation (bkz. conversation_service.prepare_conversation) verilirse takip sorusu
+    arama için yeniden yazılır ve prompt sohbet geçmişiyle kurulur.
+    """
+    # 1. İlgili Doküman Parçalarını Bul (Retrieval)
+    search_query = user_message
+    if conversation:
+        search_query = await conversation_service.rewrite_question(
+            user_message, conversation["history"], conversation["summary"]
+        )
+    
+    # Soru vektörü ve retrieval (SQL, rerank, MMR) event loop'u bloklamadan hesaplanır
+    query_vector = await generate_query_embedding_async(search_query)
+    relevant_hits = await asyncio.get_running_loop().run_in_executor(
+        None, _retrieve_context_in_session, search_query, query_vector, filters
+    )
+    
+    if not relevant_hits:
+        return None, [], query_vector
+
+    # 2. Context Oluştur
+    context_text = ""
+    sources = []
+    
+    for hit in relevant_hits:
+        # Sadece soruyla ilgili parçaları gönder (parçası olmayan eski dokümanlarda içeriğin başı)
+        doc_content = "\n...\n".join(chunk["content"] for chunk in hit["chunks"])
+        
+        context_text += f"-- KAYNAK: {hit['title']} --\n{doc_content}\n\n"
+        sources.append({
+            "id": hit["id"],
+            "title": hit["title"],
+            "url": hit["url"],
+            "content": doc_content,
+            "similarity": round(hit["similarity"], 4) if hit["similarity"] is not None else 0.0
+        })
+
+    # 3. LLM Prompt Hazırla (Augmentation)
+    if conversation and conversation["context"]:
+        return _build_followup_prompt(context_text, user_message), sources, query_vector
+    return _build_prompt(context_text, user_message, conversation), sources, query_vector
+
+async def _prepare_conversation(history: list, state: dict):
+    """Geçmiş yoksa None (tek soruluk sohbet, cevap cache'i kullanılabilir)"""
+    if not history and not (state and state.get("context")):
+        return None
+    conversation = await conversation_service.prepare_conversation(history, state)
+    conversation["history"] = history
+    return conversation
+
+def _conversation_state(conversation: dict, context: list = None):
+    """İstemciye dönen durum; tek soruluk sohbette de yeni context ile döner"""
+    if conversation is None:
+        conversation = {"summary": "", "summarized_turns": 0}
+    return conversation_service.next_state(conversation, context)
+
+async def _cache_lookup(query_vector: list, sources: list[dict]):
+    """Benzer soru aynı kaynaklarla daha önce cevaplandıysa cache'teki cevap (DB sorgusu executor'da)"""
+    return await asyncio.get_running_loop().run_in_executor(
+        None, answer_cache.get_cached_answer, query_vector, [source["id"] for source in sources]
+    )
+
+async def _cache_store(user_message: str, query_vector: list, sources: list[dict], answer: str):
+    await asyncio.get_running_loop().run_in_executor(
+        None, answer_cache.store_answer, user_message, query_vector, [source["id"] for source in sources], answer
+    )
+
+async def chat_with_data(user_message: str, history: list = None, state: dict = None, filters: dict = None):
+    """
+    RAG Pipeline: Retrieval -> Augmentation -> Generation
+    history/state: önceki mesajlar ve önceki cevapta dönen "conversation" (çok turlu sohbet)
+    filters: sadece bu dokümanlarda ara (bkz. schemas.SearchFilters)
+    """
+    conversation = await _prepare_conversation(history, state)
+    previous_context = conversation["context"] if conversation else None
+    
+    prompt, sources, query_vector = await _prepare_chat(user_message, conversation, filters)
+    if prompt is None:
+        return {
+            "answer": NO_RESULT_ANSWER,
+            "sources": [],
+            "conversation": _conversation_state(conversation, previous_context)
+        }
+    
+    # Benzer soru aynı kaynaklarla cevaplandıysa LLM'i çağırma (sadece geçmişi olmayan sorular)
+    cached = await _cache_lookup(query_vector, sources) if conversation is None else None
+    if cached:
+        return {
+            "answer": cached["answer"],
+            "sources": sources,
+            "cached": True,
+            "conversation": _conversation_state(None)
+        }
+
     # 4. Cevap Üret (Generation) - Ollama kullan
+    context = previous_context
     try:
-        import ollama
-        ollama_response = ollama.generate(
-            model='llama3',
-            prompt=prompt
-        )
+        ollama_response = await llm_client.generate(prompt, context=previous_context)
         answer = ollama_response.get('response', '').strip()
+        context = ollama_response.get('context') or previous_context
         
         if not answer:
-            answer = "Üzgünüm, şu anda cevap üretemiyorum. Lütfen tekrar deneyin."
+            answer = EMPTY_ANSWER
+        elif conversation is None:
+            await _cache_store(user_message, query_vector, sources, answer)
     except Exception as e:
         logger.error(f"Ollama hatası: {e}")
-        answer = "Üzgünüm, AI servisi şu anda kullanılamıyor. Lütfen daha sonra tekrar deneyin."
+        answer = LLM_ERROR_ANSWER
     
     return {
         "answer": answer,
-        "sources": sources
+        "sources": sources,
+        "conversation": _conversation_state(conversation, context)
     }
 
+def _ns_to_ms(value) -> float:
+    return round(value / 1e6, 1) if value else None
+
+async def stream_chat_with_data(user_message: str, history: list = None, state: dict = None, filters: dict = None):
+    """
+    chat_with_data'nın streaming versiyonu. (event, data) çiftleri üretir:
+        ("sources", {"sources": [...]})   -> retrieval biter bitmez
+        ("token", {"content": "..."})    -> Ollama her parça ürettiğinde
+        ("error", {"message": "..."})    -> LLM hatası (varsa)
+        ("done", {"answer": "...", "conversation": {...}, "timings": {...}})
+    """
+    started = time.perf_counter()
+    
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+    
+    conversation = await _prepare_conversation(history, state)
+    previous_context = conversation["context"] if conversation else None
+    
+    prompt, sources, query_vector = await _prepare_chat(user_message, conversation, filters)
+    retrieval_ms = elapsed_ms()
+    yield "sources", {"sources": sources}
+    
+    if prompt is None:
+        yield "token", {"content": NO_RESULT_ANSWER}
+        yield "done", {
+            "answer": NO_RESULT_ANSWER,
+            "conversation": _conversation_state(conversation, previous_context),
+            "timings": {"retrieval_ms": retrieval_ms, "total_ms": elapsed_ms()}
+        }
+        return
+    
+    cached = await _cache_lookup(query_vector, sources) if conversation is None else None
+    if cached:
+        yield "token", {"content": cached["answer"]}
+        yield "done", {
+            "answer": cached["answer"],
+            "cached": True,
+            "conversation": _conversation_state(None),
+            "timings": {"retrieval_ms": retrieval_ms, "total_ms": elapsed_ms()}
+        }
+        return
+    
+    parts = []
+    final = {}
+    first_token_ms = None
+    try:
+        # İstemci bağlantıyı koparırsa da Ollama isteği kapanır, kuyruk slotu bırakılır
+        async with aclosing(llm_client.generate_stream(prompt, context=previous_context)) as stream:
+            async for part in stream:
+                token = part.get('response', '')
+                if token:
+                    if first_token_ms is None:
+                        first_token_ms = elapsed_ms()
+                    parts.append(token)
+                    yield "token", {"content": token}
+                if part.get('done'):
+                    final = part
+    except Exception as e:
+        logger.error(f"Ollama hatası: {e}")
+        yield "error", {"message": LLM_ERROR_ANSWER}
+    
+    answer = "".join(parts).strip()
+    if answer and final and conversation is None:
+        await _cache_store(user_message, query_vector, sources, answer)
+    eval_ms = _ns_to_ms(final.get('eval_duration'))
+    yield "done", {
+        "answer": answer or (LLM_ERROR_ANSWER if not final else EMPTY_ANSWER),
+        "conversation": _conversation_state(conversation, final.get('context') or previous_context),
+        "timings": {
+            "retrieval_ms": retrieval_ms,
+            "first_token_ms": first_token_ms,
+            "total_ms": elapsed_ms(),
+            "llm_load_ms": _ns_to_ms(final.get('load_duration')),
+            "prompt_eval_ms": _ns_to_ms(final.get('prompt_eval_duration')),
+            "prompt_tokens": final.get('prompt_eval_count'),
+            "eval_ms": eval_ms,
+            "completion_tokens": final.get('eval_count'),
+            "tokens_per_sec": round(final['eval_count'] / (eval_ms / 1000), 2) if eval_ms and final.get('eval_count') else None
+        }
+    }
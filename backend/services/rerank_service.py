@@ -0,0 +1,68 @@
+"""
+Rerank Service - Cross-encoder ile (soru, parça) çiftlerini yeniden puanlar
+Vektör araması geniş bir aday kümesi getirir; cross-encoder soruyla parçayı birlikte
+okuyarak daha isabetli bir sıralama verir. Skorlar (soru, parça içeriği) bazında cache'lenir.
+"""
+from sentence_transformers import CrossEncoder
+from services.embedding_cache import normalize_text, compute_content_hash
+from services.lru_cache import LRUCache
+from config import settings
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_reranker():
+    """Cross-encoder modelini yükler (lazy loading)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                logger.info(f"Rerank modeli yükleniyor: {settings.RERANK_MODEL}...")
+                _model = CrossEncoder(settings.RERANK_MODEL, max_length=settings.RERANK_MAX_LENGTH, device="cpu")
+                logger.info("Rerank modeli yüklendi.")
+    return _model
+
+def _score_cache_key(query: str, passage: str):
+    # Parça id'si yerine içerik hash'i: yeniden indekslenen (değişmiş) parça eski skoru kullanmaz
+    return (settings.RERANK_MODEL, normalize_text(query).lower(), compute_content_hash(passage))
+
+def score_passages(query: str, passages: list[str]) -> list[float]:
+    """
+    Her parçanın soruyla alaka skoru (büyük = daha alakalı), giriş sırasıyla.
+    Cache'te olmayan çiftler tek batch'te puanlanır.
+    """
+    if not passages:
+        return []
+
+    keys = [_score_cache_key(query, passage) for passage in passages]
+    scores = [_score_cache.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+
+    if missing:
+        predicted = get_reranker().predict(
+            [(query, passages[i]) for i in missing],
+            batch_size=len(missing),
+            show_progress_bar=False
+        )
+        for i, score in zip(missing, predicted):
+            scores[i] = float(score)
+            _score_cache.set(keys[i], scores[i])
+
+    return scores
+
+_score_cache = LRUCache(
+    max_size=settings.RERANK_CACHE_MAX_SIZE,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS
+)
+
+def get_rerank_stats() -> dict:
+    return {
+        "enabled": settings.RERANK_ENABLED,
+        "model": settings.RERANK_MODEL,
+        "model_loaded": _model is not None,
+        "score_cache": _score_cache.stats()
+    }
@@ -0,0 +1,310 @@
+"""
+RSS Service - Feed çekme ve arka plan yenileme zamanlayıcısı
+Aktif feed'ler (is_active == "true") RSS_REFRESH_INTERVAL_SECONDS aralıkla paralel çekilir:
+aynı anda en fazla RSS_MAX_CONCURRENCY feed, aynı sunucudan en fazla RSS_PER_HOST_CONCURRENCY.
+Her worker zamanlayıcıyı çalıştırır ama Postgres advisory lock sayesinde bir turu aynı anda
+sadece biri yapar; zamanı gelmemiş feed'ler (last_checked_at) atlandığı için sıradaki
+worker aynı feed'leri tekrar çekmez. Hatalı feed'ler üstel olarak daha seyrek denenir.
+
+Conditional GET: son işlenen içeriğin ETag/Last-Modified değerleri sonraki istekte gönderilir;
+304 dönerse ya da içerik hash'i aynıysa feed parse edilmez, makale sorguları yapılmaz
+(sadece çekme istatistiği güncellenir).
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from database import engine, SessionLocal
+from models import RSSFeed, Article, ArticleStatus
+from config import settings
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+import feedparser
+import asyncio
+import hashlib
+import logging
+import httpx
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Birden fazla worker aynı anda yenileme turu yapmasın (vector_index.INDEX_LOCK_KEY'den farklı)
+RSS_LOCK_KEY = 7_384_002
+
+# Feed başına işlenecek en fazla kayıt (en yeniler)
+MAX_ENTRIES = 50
+
+USER_AGENT = "TUYGUN-RSS/1.0 (+feedparser)"
+
+class FeedFetchError(Exception):
+    """Feed indirilemedi ya da parse edilemedi"""
+
+_client = None
+_host_semaphores = {}
+_global_semaphore = None
+
+def get_client() -> httpx.AsyncClient:
+    """Feed indirmeleri için paylaşılan HTTP istemcisi (lazy, bağlantılar yeniden kullanılır)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.RSS_FETCH_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=settings.RSS_MAX_CONCURRENCY)
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+async def download_feed(url: str, etag: str = None, last_modified: str = None) -> httpx.Response:
+    """
+    Feed'i indirir (event loop'u bloklamaz). Doğrulayıcılar verilirse conditional GET yapılır;
+    içerik değişmediyse sunucu 304 döner (gövdesiz). Raises: FeedFetchError
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        response = await get_client().get(url, headers=headers)
+        # raise_for_status 304'ü de hata sayar
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+    except httpx.HTTPError as e:
+        raise FeedFetchError(f"Feed indirilemedi: {e}") from e
+
+def content_hash(response: httpx.Response) -> str:
+    return hashlib.sha256(response.content).hexdigest()
+
+def is_unchanged(response: httpx.Response, previous_hash: str = None) -> bool:
+    """304 Not Modified ya da (doğrulayıcı desteklemeyen sunucularda) son işlenenle aynı içerik"""
+    if response.status_code == 304:
+        return True
+    return bool(previous_hash) and content_hash(response) == previous_hash
+
+def feed_validators(response: httpx.Response) -> dict:
+    """İşlenen içeriğin doğrulayıcıları (RSSFeed kolonlarına yazılır)"""
+    return {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "content_hash": content_hash(response)
+    }
+
+def parse_feed(response: httpx.Response):
+    """İndirilen feed'i parse eder (CPU işi; executor'da çağrılmalı)"""
+    headers = dict(response.headers)
+    # Göreli linkler ve karakter seti için feedparser'a asıl URL ve header'lar verilir
+    headers["content-location"] = str(response.url)
+    return feedparser.parse(response.content, response_headers=headers)
+
+def _published_at(entry):
+    if getattr(entry, "published_parsed", None):
+        try:
+            return datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+def store_entries(db: Session, feed: RSSFeed, entries: list) -> list[dict]:
+    """
+    Feed kayıtlarından henüz olmayan makaleleri pending olarak ekler (içerik sonra scrape edilir).
+    Aynı URL'yi aynı anda ekleyen başka bir feed/worker varsa ON CONFLICT ile atlanır.
+    Commit çağıran tarafa bırakılır.
+
+    Returns:
+        Eklenen makaleler: [{"id", "feed_id", "title", "url", "author", "published_at", "status"}, ...]
+    """
+    rows = {}
+    for entry in entries[:MAX_ENTRIES]:
+        url = getattr(entry, "link", None)
+        title = getattr(entry, "title", None)
+        if not url or not title or url in rows:
+            continue
+        rows[url] = {
+            "id": str(uuid.uuid4()),
+            "feed_id": feed.id,
+            "title": title,
+            "url": url,
+            "author": getattr(entry, "author", None),
+            "published_at": _published_at(entry),
+            "status": ArticleStatus.pending
+        }
+    if not rows:
+        return []
+
+    # Zaten var olanlar tek sorguda elenir
+    existing = set(db.execute(select(Article.url).where(Article.url.in_(list(rows)))).scalars())
+    new_rows = [row for url, row in rows.items() if url not in existing]
+    if not new_rows:
+        return []
+
+    inserted = set(db.execute(
+        insert(Article).values(new_rows).on_conflict_do_nothing(index_elements=["url"]).returning(Article.id)
+    ).scalars())
+    return [row for row in new_rows if row["id"] in inserted]
+
+def record_fetch(feed: RSSFeed, started: float, error: str = None, validators: dict = None):
+    """
+    Feed'in çekme istatistiklerini günceller (commit çağıran tarafa bırakılır).
+    validators: içerik işlendiyse sonraki conditional GET için ETag/Last-Modified/hash
+    """
+    now = datetime.now(timezone.utc)
+    feed.last_checked_at = now
+    feed.last_fetch_duration_ms = int((time.perf_counter() - started) * 1000)
+    feed.fetch_count = (feed.fetch_count or 0) + 1
+    if error:
+        feed.error_count = (feed.error_count or 0) + 1
+        feed.consecutive_errors = (feed.consecutive_errors or 0) + 1
+        feed.last_error = error[:1000]
+    else:
+        feed.last_fetched_at = now
+        feed.consecutive_errors = 0
+        feed.last_error = None
+    for name, value in (validators or {}).items():
+        setattr(feed, name, value)
+
+# --- Zamanlayıcı ---
+
+def _is_due(feed, now: datetime) -> bool:
+    if feed.last_checked_at is None:
+        return True
+    backoff = 2 ** min(feed.consecutive_errors or 0, settings.RSS_MAX_BACKOFF_EXPONENT)
+    return now - feed.last_checked_at >= timedelta(seconds=settings.RSS_REFRESH_INTERVAL_SECONDS * backoff)
+
+def _due_feeds() -> list:
+    """Zamanı gelmiş aktif feed'ler (id, url, doğrulayıcılar; en uzun süredir denenmeyenden başlayarak)"""
+    db = SessionLocal()
+    try:
+        feeds = db.execute(
+            select(
+                RSSFeed.id, RSSFeed.url, RSSFeed.last_checked_at, RSSFeed.consecutive_errors,
+                RSSFeed.etag, RSSFeed.last_modified, RSSFeed.content_hash
+            )
+            .where(RSSFeed.is_active == "true")
+            .order_by(RSSFeed.last_checked_at.asc().nulls_first())
+        ).all()
+        now = datetime.now(timezone.utc)
+        return [feed for feed in feeds if _is_due(feed, now)]
+    finally:
+        db.close()
+
+def _save_refresh(feed_id: str, started: float, parsed=None, error: str = None, validators: dict = None) -> int:
+    """
+    Yeni makaleleri ve istatistikleri kendi session'ında yazar; eklenen makale sayısını döner.
+    parsed None ise (içerik değişmedi) sadece istatistik güncellenir.
+    """
+    db = SessionLocal()
+    try:
+        feed = db.query(RSSFeed).filter(RSSFeed.id == feed_id).first()
+        if not feed:
+            return 0
+        added = store_entries(db, feed, parsed.entries) if parsed is not None and not error else []
+        record_fetch(feed, started, error, validators)
+        db.commit()
+        return len(added)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"RSS feed kaydedilemedi ({feed_id}): {e}")
+        return 0
+    finally:
+        db.close()
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).hostname or ""
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _host_semaphores[host] = asyncio.Semaphore(settings.RSS_PER_HOST_CONCURRENCY)
+    return semaphore
+
+async def refresh_feed(feed) -> int:
+    """
+    Tek feed'i çeker ve yeni makaleleri kaydeder (hata olursa istatistiğe yazılır).
+    feed: _due_feeds satırı (id, url, etag, last_modified, content_hash)
+
+    Returns:
+        Eklenen makale sayısı; içerik değişmediyse None
+    """
+    global _global_semaphore
+    if _global_semaphore is None:
+        _global_semaphore = asyncio.Semaphore(settings.RSS_MAX_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+
+    started = time.perf_counter()
+    try:
+        # Önce sunucu slotu alınır: aynı sunucuyu bekleyen feed global slot tutmasın
+        async with _host_semaphore(feed.url), _global_semaphore:
+            started = time.perf_counter()
+            response = await download_feed(feed.url, feed.etag, feed.last_modified)
+            if is_unchanged(response, feed.content_hash):
+                await loop.run_in_executor(None, _save_refresh, feed.id, started)
+                return None
+            parsed = await loop.run_in_executor(None, parse_feed, response)
+            if parsed.bozo and not parsed.entries:
+                raise FeedFetchError(f"Feed parse edilemedi: {parsed.get('bozo_exception')}")
+    except Exception as e:
+        # FeedFetchError dışında geçersiz URL (httpx.InvalidURL, urlsplit ValueError) vb. de
+        # feed'e yazılır; diğer feed'lerin turu yarıda kalmaz
+        error = str(e) if isinstance(e, FeedFetchError) else f"{type(e).__name__}: {e}"
+        logger.warning(f"RSS feed çekilemedi ({feed.url}): {error}")
+        return await loop.run_in_executor(None, _save_refresh, feed.id, started, None, error)
+    return await loop.run_in_executor(
+        None, _save_refresh, feed.id, started, parsed, None, feed_validators(response)
+    )
+
+def _try_lock():
+    """Advisory lock alınırsa lock'u tutan bağlantıyı döner, başka worker'daysa None"""
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RSS_LOCK_KEY}).scalar():
+        return conn
+    conn.close()
+    return None
+
+def _release_lock(conn):
+    try:
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RSS_LOCK_KEY})
+    finally:
+        conn.close()
+
+async def run_refresh_cycle() -> dict:
+    """Zamanı gelen tüm aktif feed'leri paralel yeniler (başka worker tur yapıyorsa atlar)"""
+    loop = asyncio.get_running_loop()
+    conn = await loop.run_in_executor(None, _try_lock)
+    if conn is None:
+        return {"skipped": True}
+
+    try:
+        feeds = await loop.run_in_executor(None, _due_feeds)
+        if not feeds:
+            return {"feeds": 0, "unchanged": 0, "articles": 0}
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(refresh_feed(feed) for feed in feeds))
+        summary = {
+            "feeds": len(feeds),
+            "unchanged": sum(1 for added in results if added is None),
+            "articles": sum(added for added in results if added)
+        }
+        logger.info(
+            f"RSS yenileme: {summary['feeds']} feed ({summary['unchanged']} değişmemiş), "
+            f"{summary['articles']} yeni makale, {time.perf_counter() - started:.1f} sn"
+        )
+        return summary
+    finally:
+        await loop.run_in_executor(None, _release_lock, conn)
+
+async def run_rss_scheduler():
+    """Aktif feed'leri arka planda yenileyen döngü (RSS_SCHEDULER_TICK_SECONDS aralıkla kontrol)"""
+    logger.info("RSS zamanlayıcı başlatıldı.")
+    while True:
+        try:
+            await run_refresh_cycle()
+        except Exception as e:
+            logger.error(f"RSS zamanlayıcı hatası: {e}")
+        await asyncio.sleep(settings.RSS_SCHEDULER_TICK_SECONDS)
@@ -0,0 +1,237 @@
+"""
+Vector Index - pgvector ANN index yönetimi ve arama ifadeleri
+Her vektör tablosunda tek bir yönetilen ANN index'i (HNSW veya IVFFlat) tutulur; tanımı
+config.Settings'ten üretilir, ayarlar değişince index yeniden kurulur.
+
+VECTOR_STORAGE_MODE "halfvec" veya "binary" iken index embedding'in quantize edilmiş
+kopyası (expression index) üzerine kurulur; ilk tarama bu index'te yapılır, adaylar
+tam (float32) vektörle yeniden sıralanır.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import cast, func, text
+from database import engine
+from models import VECTOR_AVAILABLE
+from config import settings
+import hashlib
+import logging
+
+if VECTOR_AVAILABLE:
+    from pgvector.sqlalchemy import Vector, HALFVEC, BIT
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 384
+STORAGE_MODES = ("full", "halfvec", "binary")
+INDEX_TYPES = ("hnsw", "ivfflat", "none")
+DISTANCES = ("cosine", "inner_product")
+
+# halfvec ve binary_quantize pgvector 0.7.0 ile geldi
+QUANTIZATION_MIN_VERSION = (0, 7, 0)
+
+# Vektör kolonu olan tablolar (parça araması + eski dokümanlar için doküman seviyesi arama)
+VECTOR_TABLES = ("document_chunks", "documents")
+
+# Birden fazla worker aynı anda index kurmaya çalışmasın
+INDEX_LOCK_KEY = 7_384_001
+
+def storage_mode() -> str:
+    mode = (settings.VECTOR_STORAGE_MODE or "full").lower()
+    if mode not in STORAGE_MODES:
+        logger.warning(f"Bilinmeyen VECTOR_STORAGE_MODE '{mode}', 'full' kullanılıyor.")
+        return "full"
+    return mode
+
+def index_type() -> str:
+    kind = (settings.VECTOR_INDEX_TYPE or "none").lower()
+    if kind not in INDEX_TYPES:
+        logger.warning(f"Bilinmeyen VECTOR_INDEX_TYPE '{kind}', 'hnsw' kullanılıyor.")
+        return "hnsw"
+    return kind
+
+def use_inner_product() -> bool:
+    """Vektörler normalize olduğu için iç çarpım, cosine ile aynı sıralamayı daha ucuza verir"""
+    return (settings.VECTOR_DISTANCE or "cosine").lower() == "inner_product"
+
+# --- Arama ifadeleri ---
+
+def distance_expression(column, query_vector: list):
+    """
+    Tam vektör mesafesi (küçük = daha yakın). inner_product'ta pgvector'ın <#> operatörü
+    negatif iç çarpım döner; normalize vektörlerde cosine_distance = 1 + <#>.
+    """
+    if use_inner_product():
+        return column.max_inner_product(query_vector)
+    return column.cosine_distance(query_vector)
+
+def similarity_expression(column, query_vector: list):
+    """Cosine similarity (1 = aynı yön). Normalize vektörlerde iç çarpım ile aynıdır."""
+    if use_inner_product():
+        return -column.max_inner_product(query_vector)
+    return 1 - column.cosine_distance(query_vector)
+
+def similarity_from_distance(distance):
+    """distance_expression'ın sonucundan (örn. ORDER BY için seçilmiş kolon) similarity_expression ile aynı skor"""
+    if use_inner_product():
+        return -distance
+    return 1 - distance
+
+def quantized_distance(column, query_vector: list):
+    """
+    İlk tarama için quantize edilmiş mesafe ifadesi (index ifadesiyle birebir aynı olmalı).
+    "full" modda None döner (tek aşamalı arama).
+    """
+    mode = storage_mode()
+    if mode == "halfvec":
+        half = HALFVEC(EMBEDDING_DIMENSION)
+        column, query = cast(column, half), cast(query_vector, half)
+        return column.max_inner_product(query) if use_inner_product() else column.cosine_distance(query)
+    if mode == "binary":
+        bits = BIT(EMBEDDING_DIMENSION)
+        query_bits = func.binary_quantize(cast(query_vector, Vector(EMBEDDING_DIMENSION)))
+        return cast(func.binary_quantize(column), bits).hamming_distance(cast(query_bits, bits))
+    return None
+
+def candidate_count(limit: int) -> int:
+    """Tam vektörle yeniden sıralanacak aday sayısı"""
+    return max(settings.VECTOR_RERANK_CANDIDATES, limit * 4)
+
+def index_scan_limit(k: int) -> int:
+    """ANN index'e giden sorgunun LIMIT'i: quantize modda ilk aşamanın aday sayısı, tam modda k"""
+    return k if storage_mode() == "full" else candidate_count(k)
+
+def apply_search_settings(db: Session, filtered: bool = False, limit: int = 0):
+    """
+    Sorgu anı ANN ayarları (sadece mevcut transaction için geçerli).
+    ef_search/probes arttıkça recall artar, gecikme de artar.
+    filtered: WHERE filtresi index taramasından sonra uygulanır; taranan aday sayısı
+    artırılmazsa seçici filtrelerde LIMIT'ten az satır dönebilir.
+    limit: index taramasının LIMIT'i (bkz. index_scan_limit).
+    """
+    kind = index_type()
+    if kind == "hnsw":
+        # ef_search, LIMIT'ten küçükse HNSW en fazla ef_search satır döndürebilir
+        ef_search = max(settings.HNSW_EF_SEARCH, settings.HNSW_FILTERED_EF_SEARCH) if filtered else settings.HNSW_EF_SEARCH
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {int(max(ef_search, limit))}"))
+    elif kind == "ivfflat":
+        probes = max(settings.IVFFLAT_PROBES, settings.IVFFLAT_FILTERED_PROBES) if filtered else settings.IVFFLAT_PROBES
+        db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+
+# --- Index yönetimi ---
+
+def ann_index_name(table: str) -> str:
+    return f"ix_{table}_embedding_ann"
+
+def _index_target(mode: str) -> str:
+    """Index'lenecek ifade ve operator class"""
+    ops = "ip" if use_inner_product() else "cosine"
+    if mode == "halfvec":
+        return f"(embedding::halfvec({EMBEDDING_DIMENSION})) halfvec_{ops}_ops"
+    if mode == "binary":
+        return f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSION})) bit_hamming_ops"
+    return f"embedding vector_{ops}_ops"
+
+def _ivfflat_lists(conn, table: str) -> int:
+    """IVFFLAT_LISTS=0 ise pgvector önerisi: ~satır/1000 (en az 10)"""
+    if settings.IVFFLAT_LISTS > 0:
+        return settings.IVFFLAT_LISTS
+    rows = conn.execute(text(f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL")).scalar() or 0
+    if rows < 10000:
+        logger.warning(f"{table}: IVFFlat az satırla ({rows}) kuruluyor; veri büyüyünce yeniden kurun.")
+    return max(10, rows // 1000)
+
+def index_statement(conn, table: str, mode: str, kind: str) -> str:
+    if kind == "hnsw":
+        params = f"m = {int(settings.HNSW_M)}, ef_construction = {int(settings.HNSW_EF_CONSTRUCTION)}"
+    else:
+        params = f"lists = {_ivfflat_lists(conn, table)}"
+    return (
+        f"CREATE INDEX CONCURRENTLY {ann_index_name(table)} "
+        f"ON {table} USING {kind} ({_index_target(mode)}) WITH ({params})"
+    )
+
+def _definition_signature(mode: str, kind: str) -> str:
+    """
+    Index ayarlarının imzası (index comment'ine yazılır). IVFFlat'te otomatik lists
+    imzaya girmez; yoksa her satır artışında index yeniden kurulurdu.
+    """
+    if kind == "hnsw":
+        params = f"m={settings.HNSW_M},ef_construction={settings.HNSW_EF_CONSTRUCTION}"
+    else:
+        params = f"lists={settings.IVFFLAT_LISTS or 'auto'}"
+    definition = f"{kind}|{_index_target(mode)}|{params}"
+    return f"tuygun:{hashlib.sha256(definition.encode('utf-8')).hexdigest()[:16]}"
+
+def get_pgvector_version(conn) -> tuple:
+    """Kurulu pgvector extension sürümü, örn. (0, 7, 4); kurulu değilse ()"""
+    version = conn.execute(text(
+        "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+    )).scalar()
+    if not version:
+        return ()
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+def _current_index(conn, name: str):
+    """(comment, geçerli mi) ya da index yoksa None"""
+    return conn.execute(text(
+        "SELECT obj_description(c.oid, 'pg_class'), i.indisvalid "
+        "FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"
+    ), {"name": name}).first()
+
+def ensure_vector_indexes(mode: str = None) -> dict:
+    """
+    Vektör tablolarındaki yönetilen ANN index'lerini ayarlarla eşitler:
+    yoksa oluşturur, tanımı değiştiyse ya da yarım kalmış (invalid) ise yeniden kurar,
+    VECTOR_INDEX_TYPE=none ise kaldırır. CONCURRENTLY kullanılır, tablo yazmaya kapanmaz.
+
+    Returns:
+        {tablo: "created" | "rebuilt" | "unchanged" | "dropped" | "skipped"}
+    """
+    mode = mode or storage_mode()
+    kind = index_type()
+    signature = _definition_signature(mode, kind)
+    result = {}
+
+    # CREATE/DROP INDEX CONCURRENTLY transaction içinde çalışamaz
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": INDEX_LOCK_KEY}).scalar():
+            logger.info("Vektör index'leri başka bir worker tarafından kontrol ediliyor, atlanıyor.")
+            return {table: "skipped" for table in VECTOR_TABLES}
+
+        try:
+            if kind != "none" and mode != "full" and get_pgvector_version(conn) < QUANTIZATION_MIN_VERSION:
+                raise RuntimeError(
+                    "halfvec/binary_quantize için pgvector >= 0.7.0 gerekli. "
+                    "ALTER EXTENSION vector UPDATE; ile güncelleyin."
+                )
+
+            for table in VECTOR_TABLES:
+                name = ann_index_name(table)
+                current = _current_index(conn, name)
+
+                if kind == "none":
+                    if current:
+                        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                        result[table] = "dropped"
+                    else:
+                        result[table] = "unchanged"
+                    continue
+
+                if current and current[0] == signature and current[1]:
+                    result[table] = "unchanged"
+                    continue
+
+                if current:
+                    logger.info(f"{name} tanımı değişti veya geçersiz, yeniden kuruluyor...")
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+                statement = index_statement(conn, table, mode, kind)
+                logger.info(f"Vektör index'i oluşturuluyor: {statement}")
+                conn.execute(text(statement))
+                conn.execute(text(f"COMMENT ON INDEX {name} IS '{signature}'"))
+                conn.execute(text(f"ANALYZE {table}"))
+                result[table] = "rebuilt" if current else "created"
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INDEX_LOCK_KEY})
+
+    logger.info(f"Vektör index'leri: {result}")
+    return result
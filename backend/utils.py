@@ -59,3 +59,10 @@ def format_file_size(size_bytes: Optional[int]) -> str:
         size_bytes /= 1024.0
     return f"{size_bytes:.1f} PB"
 
+
+def generate_safe_filename(title: str, max_length: int = 100) -> str:
+    """
+    Başlıktan dosya sistemi için güvenli bir dosya adı üretir (geçersiz karakterleri kaldırır)
+    """
+    safe_title = "".join(c for c in (title or "") if c.isalnum() or c in (' ', '-', '_')).strip()[:max_length]
+    return safe_title or str(uuid.uuid4())
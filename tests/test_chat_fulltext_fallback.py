@@ -0,0 +1,60 @@
+"""
+Query embedding oluşturulamadığında sohbet full-text aramayla cevap vermeli.
+Backend modülleriyle, DATABASE_URL'deki veritabanına karşı çalışır (API sunucusu gerekmez);
+embedding ve Ollama çağrıları taklit edilir, test bitince eski hallerine döner.
+
+Kullanım: cd backend && python ../tests/test_chat_fulltext_fallback.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import httpx
+import pytest
+from database import SessionLocal
+from models import DocumentChunk
+from services import rag_service, llm_client
+
+async def _no_embedding(query):
+    # generate_query_embedding_async model hatasında boş liste döner
+    return []
+
+def _ollama(request):
+    if request.url.path != "/api/generate":
+        return httpx.Response(404)
+    if b'"stream": true' in request.content or b'"stream":true' in request.content:
+        return httpx.Response(200, content=b'{"response": "cevap", "done": false}\n{"response": "", "done": true, "context": [1]}\n')
+    return httpx.Response(200, json={"response": "cevap", "context": [1]})
+
+def _question() -> str:
+    """Veritabanındaki bir parçadan kelimeler (full-text aramanın bulabileceği bir soru)"""
+    db = SessionLocal()
+    try:
+        content = db.query(DocumentChunk.content).filter(DocumentChunk.content.isnot(None)).limit(1).scalar()
+    finally:
+        db.close()
+    return " ".join((content or "").split()[:5])
+
+async def _run(question):
+    response = await rag_service.chat_with_data(question)
+    events = [event async for event, _ in rag_service.stream_chat_with_data(question)]
+    return response, events
+
+def test_chat_fulltext_fallback(monkeypatch):
+    print("Testing chat with failed query embedding...")
+    question = _question()
+    if not question:
+        pytest.skip("Veritabanında parça yok")
+
+    monkeypatch.setattr(rag_service, "generate_query_embedding_async", _no_embedding)
+    monkeypatch.setattr(llm_client, "_client", httpx.AsyncClient(base_url="http://ollama", transport=httpx.MockTransport(_ollama)))
+    response, events = asyncio.run(_run(question))
+
+    assert response["answer"], response
+    assert "done" in events and "error" not in events, events
+    print(f"✅ Success: {len(response['sources'])} kaynakla cevap verildi, stream: {events}")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))
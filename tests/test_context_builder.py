@@ -0,0 +1,66 @@
+"""
+context_builder.select_passages: token bütçesi, doküman sınırı ve tekrar eden parçaların elenmesi.
+Veritabanı ve model gerekmez (vektörler elle verilir).
+
+Kullanım: python tests/test_context_builder.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import pytest
+from services.context_builder import select_passages
+
+QUERY = [1.0, 0.0, 0.0]
+
+def _passage(document_id: str, tokens: int) -> dict:
+    return {"document_id": document_id, "content": f"{document_id} içerik", "token_count": tokens}
+
+def test_token_budget():
+    passages = [_passage("a", 60), _passage("b", 60), _passage("c", 60)]
+    embeddings = [[1.0, 0.1, 0.0], [0.9, 0.0, 0.4], [0.8, 0.0, -0.6]]
+
+    selected = select_passages(QUERY, passages, embeddings, max_tokens=130, max_documents=5, mmr_lambda=1.0)
+
+    assert [p["document_id"] for p in selected] == ["a", "b"]
+    assert sum(p["token_count"] for p in selected) <= 130
+    print("✅ Success: bütçe aşılmadı")
+
+def test_first_passage_kept_over_budget():
+    selected = select_passages(QUERY, [_passage("a", 500)], [[1.0, 0.0, 0.0]], max_tokens=100, max_documents=5)
+
+    assert [p["document_id"] for p in selected] == ["a"]
+    print("✅ Success: tek başına bütçeyi aşan en iyi parça yine gönderildi")
+
+def test_near_duplicates_dropped():
+    passages = [_passage("a", 10), _passage("b", 10), _passage("c", 10)]
+    # b, a'nın neredeyse aynısı (başka kaynakta aynı haber); c farklı
+    embeddings = [[1.0, 0.2, 0.0], [1.0, 0.21, 0.0], [0.6, 0.0, 0.8]]
+
+    selected = select_passages(QUERY, passages, embeddings, max_tokens=1000, max_documents=5, mmr_lambda=1.0)
+
+    assert [p["document_id"] for p in selected] == ["a", "c"]
+    print("✅ Success: tekrar eden parça elendi")
+
+def test_max_documents():
+    passages = [_passage("a", 10), _passage("a", 10), _passage("b", 10), _passage("c", 10)]
+    embeddings = [[1.0, 0.1, 0.0], [0.9, 0.0, 0.5], [0.8, 0.6, 0.0], [0.7, 0.0, -0.7]]
+
+    selected = select_passages(QUERY, passages, embeddings, max_tokens=1000, max_documents=2, mmr_lambda=1.0)
+
+    assert {p["document_id"] for p in selected} == {"a", "b"}
+    assert len(selected) == 3
+    print("✅ Success: doküman sınırı dolunca sadece seçilmiş dokümanların parçaları alındı")
+
+def test_candidate_order_without_query_vector():
+    passages = [_passage("a", 10), _passage("b", 10), _passage("c", 10)]
+    embeddings = [[0.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]
+
+    selected = select_passages([], passages, embeddings, max_tokens=1000, max_documents=5, mmr_lambda=1.0)
+
+    assert [p["document_id"] for p in selected] == ["a", "b", "c"]
+    print("✅ Success: soru vektörü yokken aday sırası korundu")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-s"]))